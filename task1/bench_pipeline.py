@@ -0,0 +1,92 @@
+import socket
+import os
+import subprocess
+import sys
+import time
+import argparse
+
+import bench_server
+import reversetcpclient
+from framing import FrameReader
+
+# 在本机模拟不同RTT, 对比发一块等一块和流水线模式的总传输时间
+# 客户端 -> 网络损伤代理(tools/netem_proxy.py) -> 服务器, 代理在每个方向上加RTT/2的单向时延
+PROXY_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools", "netem_proxy.py")
+
+def start_proxy(upstream_port, rtt):
+    port = bench_server.free_port()
+    proc = subprocess.Popen(
+        [sys.executable, PROXY_SCRIPT, "--proto", "tcp", "--listen", f"127.0.0.1:{port}",
+         "--target", f"127.0.0.1:{upstream_port}", "--delay", str(rtt * 1000 / 2)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    # 等待代理开始监听
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("proxy did not start")
+
+def run_transfer(port, blocks, depth):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    answers = []
+    on_answer = lambda i, text: answers.append(text)
+    start = time.perf_counter()
+    reader = FrameReader(sock)
+    try:
+        reversetcpclient.handshake(sock, reader, len(blocks))
+        if depth > 1:
+            reversetcpclient.reverse_pipelined(sock, reader, blocks, len(blocks), depth, on_answer)
+        else:
+            reversetcpclient.reverse_stop_and_wait(sock, reader, blocks, on_answer)
+    finally:
+        sock.close()
+    elapsed = time.perf_counter() - start
+    if len(answers) != len(blocks) or any(a != b[::-1] for a, b in zip(answers, blocks)):
+        raise RuntimeError("reversed blocks do not match")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Stop-and-wait vs pipelined reverseRequest transfer time")
+    parser.add_argument("--rtts", default="0,10,50,100", help="模拟的RTT列表(ms)")
+    parser.add_argument("--depths", default="1,8,32,128", help="在途请求数K列表, 1即发一块等一块")
+    parser.add_argument("--blocks", type=int, default=500)
+    parser.add_argument("--Lmin", type=int, default=20)
+    parser.add_argument("--Lmax", type=int, default=80)
+    args = parser.parse_args()
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.txt"), 'r') as f:
+        content = f.read()
+    while len(content) < args.blocks * args.Lmax:
+        content += content
+    blocks = reversetcpclient.split_blocks(content, args.Lmin, args.Lmax)[:args.blocks]
+    depths = [int(d) for d in args.depths.split(",")]
+
+    port = bench_server.free_port()
+    proc = bench_server.start_server("async", port)
+    try:
+        print(f"{'RTT(ms)':>8}" + "".join(f"{'K=' + str(d):>12}" for d in depths) + "   (seconds)")
+        for rtt in args.rtts.split(","):
+            if float(rtt) > 0:
+                proxy, proxy_port = start_proxy(port, float(rtt) / 1000)
+            else:
+                proxy, proxy_port = None, port
+            try:
+                times = [run_transfer(proxy_port, blocks, d) for d in depths]
+            finally:
+                if proxy is not None:
+                    proxy.terminate()
+                    proxy.wait()
+            print(f"{rtt:>8}" + "".join(f"{t:>12.3f}" for t in times))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import random
+import timeit
+import argparse
+
+from reverse_engine import reverse_str, reverse_utf8
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 反转引擎的微基准: 不同块大小 x 不同ASCII/中文比例, 单位为每块微秒
+# 对比对象:
+#   str:    原来的decode/反转/encode
+#   engine: reverse_engine.reverse_utf8 (服务器实际使用的实现)
+#   numpy:  候选的按字节实现, 用首字节掩码定位字符后整体反转, 需要numpy
+
+if np is not None:
+    # 首字节 -> 字符长度, 0表示不能作为首字节
+    CHAR_LEN = np.zeros(256, dtype=np.int64)
+    CHAR_LEN[0x00:0x80] = 1
+    CHAR_LEN[0xC2:0xE0] = 2
+    CHAR_LEN[0xE0:0xF0] = 3
+    CHAR_LEN[0xF0:0xF5] = 4
+
+def reverse_numpy(data):
+    arr = np.frombuffer(data, dtype=np.uint8)
+    n = arr.size
+    if arr.max() < 0x80:
+        return arr[::-1].tobytes()
+
+    # 除了10xxxxxx的后续字节, 其余都是字符的首字节
+    starts = np.flatnonzero((arr & 0xC0) != 0x80)
+    lens = np.diff(starts, append=n)
+    lead = arr[starts]
+    if starts.size == 0 or starts[0] != 0 or not np.array_equal(CHAR_LEN[lead], lens):
+        return reverse_str(data)
+
+    # 过长编码和代理区
+    multi = starts[lens > 1]
+    first = arr[multi]
+    second = arr[multi + 1]
+    if (((first == 0xE0) & (second < 0xA0)) | ((first == 0xED) & (second > 0x9F)) |
+            ((first == 0xF0) & (second < 0x90)) | ((first == 0xF4) & (second > 0x8F))).any():
+        return reverse_str(data)
+
+    # 整体反转后, 原来从s开始、长度为L的字符位于[n-s-L, n-s), 把它的字节按原顺序写回去
+    out = arr[::-1].copy()
+    for char_len in (2, 3, 4):
+        s = starts[lens == char_len]
+        if s.size:
+            p = n - s - char_len
+            for j in range(char_len):
+                out[p + j] = arr[s + j]
+    return out.tobytes()
+
+def make_block(size, cjk_ratio, rng):
+    # 按比例混合ASCII和中文字符, 截到约size字节
+    ascii_chars = "Python socket programming example "
+    cjk_chars = "网络编程反转服务器客户端数据传输测试中文内容"
+    chars = []
+    length = 0
+    while length < size:
+        c = rng.choice(cjk_chars) if rng.random() < cjk_ratio else rng.choice(ascii_chars)
+        chars.append(c)
+        length += len(c.encode('utf-8'))
+    return memoryview(bytearray("".join(chars).encode('utf-8')))
+
+def main():
+    parser = argparse.ArgumentParser(description="Reverse engine microbenchmark")
+    parser.add_argument("--sizes", default="64,1024,4096,65536,1048576")
+    parser.add_argument("--mixes", default="0,0.1,0.5,1", help="中文字符比例")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    engines = [("str", reverse_str), ("engine", reverse_utf8)]
+    if np is not None:
+        engines.append(("numpy", reverse_numpy))
+
+    print(f"{'size':>8}{'cjk':>6}" + "".join(f"{name:>10}" for name, _ in engines) + "   (us/block)")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for mix in (float(m) for m in args.mixes.split(",")):
+            block = make_block(size, mix, rng)
+            expected = reverse_str(block)
+            number = max(1, 1000000 // size)
+            times = []
+            for _, func in engines:
+                assert bytes(func(block)) == expected
+                times.append(timeit.timeit(lambda: func(block), number=number) / number * 1e6)
+            print(f"{size:>8}{mix:>6}" + "".join(f"{t:>10.1f}" for t in times))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import socket
+import struct
+import subprocess
+import sys
+import os
+import time
+import threading
+import argparse
+
+# 对比不同服务器模式的性能:
+#   - connections/sec: 每个客户端只做Init/Agree握手后立即断开
+#   - blocks/sec: 每个客户端在一条连接上发送多个reverseRequest
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reversetcpserver.py")
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def start_server(mode, port, extra_args=()):
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--mode", mode, "--host", "127.0.0.1", "--port", str(port), *extra_args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    # 等待服务器开始监听
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"server ({mode}) did not start")
+
+def recv_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+def run_client(port, blocks, payload):
+    sock = socket.create_connection(("127.0.0.1", port))
+    try:
+        sock.sendall(struct.pack('>HI', 1, blocks))
+        if struct.unpack('>H', recv_exact(sock, 2))[0] != 2:
+            raise ConnectionError("expected agree packet")
+        request = struct.pack('>HI', 3, len(payload)) + payload
+        for _ in range(blocks):
+            sock.sendall(request)
+            _, length = struct.unpack('>HI', recv_exact(sock, 6))
+            recv_exact(sock, length)
+    finally:
+        sock.close()
+
+def run_load(port, clients, conns_per_client, blocks, payload):
+    # clients个并发线程, 每个线程依次建立conns_per_client条连接
+    errors = []
+
+    def worker():
+        for _ in range(conns_per_client):
+            try:
+                run_client(port, blocks, payload)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reversetcpserver modes")
+    parser.add_argument("--modes", default="threaded,async,prefork")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="prefork模式的worker进程数")
+    parser.add_argument("--clients", type=int, default=50, help="并发客户端数")
+    parser.add_argument("--conns", type=int, default=20, help="每个客户端的连接次数")
+    parser.add_argument("--blocks", type=int, default=200, help="blocks/sec测试中每条连接的块数")
+    parser.add_argument("--block-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    payload = ("测试" * args.block_size)[:args.block_size // 3].encode('utf-8')
+
+    print(f"{'mode':<10}{'conn/s':>12}{'blocks/s':>14}{'MB/s':>10}{'errors':>8}")
+    for mode in args.modes.split(","):
+        port = free_port()
+        extra_args = ["--workers", str(args.workers)] if mode == "prefork" else []
+        proc = start_server(mode, port, extra_args)
+        try:
+            elapsed, conn_errors = run_load(port, args.clients, args.conns, 0, payload)
+            conn_rate = args.clients * args.conns / elapsed
+
+            elapsed, block_errors = run_load(port, args.clients, 1, args.blocks, payload)
+            total_blocks = args.clients * args.blocks
+            block_rate = total_blocks / elapsed
+            mb_rate = total_blocks * len(payload) / elapsed / 1e6
+        finally:
+            proc.terminate()
+            proc.wait()
+        if mode == "prefork":
+            mode = f"prefork/{args.workers}"
+        print(f"{mode:<10}{conn_rate:>12.0f}{block_rate:>14.0f}{mb_rate:>10.2f}{conn_errors + block_errors:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import socket
+import struct
+
+# ======================== 报文格式 ========================
+#   Initialization / reverseRequest / reverseAnswer: Type(2字节) + N或Length(4字节) [+ Data]
+#   Agree: 只有Type(2字节)
+#   resumeInit(Type=5) / resumeAgree(Type=6): Type(2字节) + Length(4字节) + 会话ID(16字节) + 总块数N(4字节) + 起始块号(4字节)
+HEADER = struct.Struct('>HI')
+HEADER_SIZE = HEADER.size
+AGREE = struct.Struct('>H')
+RESUME = struct.Struct('>16sII')
+
+BUFFER_SIZE = 65536  # 接收缓冲区初始大小, 遇到更大的块时自动扩大
+
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # Windows没有sendmsg
+
+class FrameReader:
+    # 带预分配缓冲区的报文读取器.
+    # 用recv_into直接收进同一个bytearray, 一次recv可能收到多个报文, 后续调用直接从缓冲区解析,
+    # 不再用data += chunk拼接. 返回的memoryview指向内部缓冲区, 只在下一次读取前有效
+    def __init__(self, sock, size=BUFFER_SIZE):
+        self.sock = sock
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # 未处理数据的起始位置
+        self.end = 0    # 未处理数据的结束位置
+
+    def _fill(self, need):#保证缓冲区中至少有need个未处理字节, 连接关闭时返回False
+        while self.end - self.start < need:
+            if len(self.buf) - self.start < need:
+                self._make_room(need)
+            n = self.sock.recv_into(self.view[self.end:])
+            if n == 0:
+                return False
+            self.end += n
+        return True
+
+    def _make_room(self, need):
+        avail = self.end - self.start
+        if need > len(self.buf):
+            # 报文比缓冲区大, 换一个更大的缓冲区(旧的memoryview仍然指向旧缓冲区)
+            new_buf = bytearray(max(need, 2 * len(self.buf)))
+            new_buf[:avail] = self.view[self.start:self.end]
+            self.buf = new_buf
+            self.view = memoryview(new_buf)
+        elif avail <= self.start:
+            # 把剩余的半个报文挪到缓冲区开头, 源和目标不重叠
+            self.buf[:avail] = self.view[self.start:self.end]
+        else:
+            self.buf[:avail] = bytes(self.view[self.start:self.end])
+        self.start, self.end = 0, avail
+
+    def read_exact(self, n):#读取n个字节, 连接提前关闭时返回None
+        if not self._fill(n):
+            return None
+        data = self.view[self.start:self.start + n]
+        self.start += n
+        if self.start == self.end:
+            self.start = self.end = 0
+        return data
+
+    def read_header(self):#读取6字节首部, 返回(Type, N或Length), 连接提前关闭时返回None
+        if not self._fill(HEADER_SIZE):
+            return None
+        header = HEADER.unpack_from(self.buf, self.start)
+        self.start += HEADER_SIZE
+        return header
+
+    def read_agree(self):#读取2字节Agree报文的Type, 连接提前关闭时返回None
+        data = self.read_exact(AGREE.size)
+        if data is None:
+            return None
+        return AGREE.unpack(data)[0]
+
+    def read_frame(self):#读取一个带数据的报文, 返回(Type, 数据memoryview), 连接提前关闭时返回None
+        header = self.read_header()
+        if header is None:
+            return None
+        type_val, length = header
+        payload = self.read_exact(length)
+        if payload is None:
+            return None
+        return type_val, payload
+
+def send_frame(sock, type_val, payload):
+    # 用sendmsg把首部和数据一起发出(scatter-gather), 不需要先拼接成一个新的bytes
+    header = HEADER.pack(type_val, len(payload))
+    if not HAS_SENDMSG:
+        sock.sendall(header + payload)
+        return
+
+    sent = sock.sendmsg([header, payload])
+    if sent < HEADER_SIZE + len(payload):
+        # 发送缓冲区满时sendmsg只发出一部分, 剩下的用sendall补齐
+        if sent < HEADER_SIZE:
+            sock.sendall(header[sent:])
+            sent = HEADER_SIZE
+        sock.sendall(memoryview(payload)[sent - HEADER_SIZE:])
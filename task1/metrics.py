@@ -0,0 +1,68 @@
+import sys
+import queue
+import threading
+import logging
+import logging.handlers
+
+# ======================== 直方图与日志 ========================
+# 直方图按2的幂分桶: 第i个桶统计 bit_length 为i的整数, 即 [2^(i-1), 2^i), 每个样本O(1)更新, 内存固定.
+# 分位数只精确到所在的桶, 返回桶的上界, 足够看出块大小和处理时间的量级分布
+# 日志: 记录只放入队列, 由QueueListener线程写到终端; 逐连接/逐块的日志为DEBUG级别, 只有 --verbose 时才输出
+# task2/metrics.py 有同样的 setup_logging 和 start_reporter(report, interval): 两个目录各自是独立运行的脚本,
+# 没有共同的包可以导入, 所以各留一份, 修改时两边保持一致. 直方图不同: 这里统计块大小/处理时间这类整数,
+# 只需要量级, 按2的幂分桶每个样本一次整数运算, 在多线程共享的stats_lock下更新也很便宜;
+# task2要的是RTT的准确分位数, 用的是rttstats的P²估计
+
+BUCKETS = 64
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):#value为非负整数
+        self.buckets[min(value.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, p):#p分位数所在桶的上界(不超过最大值); 没有样本时返回0
+        if not self.count:
+            return 0
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min((1 << i) - 1, self.max)
+        return self.max
+
+    def format(self):
+        if not self.count:
+            return "n=0"
+        return (f"n={self.count} mean={self.total / self.count:.0f} p50<={self.quantile(0.5)} "
+                f"p99<={self.quantile(0.99)} max={self.max}")
+
+def setup_logging(verbose=False):#日志经队列交给后台线程输出; 返回的listener在退出前要stop(), 把剩余日志写完
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))  # 与原来print的输出一致
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.DEBUG if verbose else logging.INFO)
+    listener.start()
+    return listener
+
+def start_reporter(report, interval):#每隔interval秒调用一次report(), 返回用来停止的Event
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            report()
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
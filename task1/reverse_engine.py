@@ -0,0 +1,17 @@
+# ======================== 按字节反转UTF-8文本 ========================
+# 结果与 data.decode('utf-8')[::-1].encode('utf-8') 逐字节相同:
+#   - 纯ASCII: 字节复制到bytearray, bytearray.isascii()检查后原地反转; ASCII字节一定是合法的UTF-8,
+#     不需要解码, 不生成任何中间字符串
+#   - 含多字节字符: 走decode/反转/encode路径, 非法UTF-8照样抛出UnicodeDecodeError.
+#     CPython对中文用2字节/字符的紧凑字符串, 这条路径已经是C实现,
+#     bench_reverse.py里基于numpy首字节掩码的按字节实现对中文块反而慢约9倍, 所以不采用
+
+def reverse_str(data):#原来的实现
+    return str(data, 'utf-8')[::-1].encode('utf-8')
+
+def reverse_utf8(data):
+    buf = bytearray(data)  # data可能是memoryview(没有isascii), 复制一次后在副本上检查和反转
+    if buf.isascii():
+        buf.reverse()
+        return buf
+    return str(data, 'utf-8')[::-1].encode('utf-8')
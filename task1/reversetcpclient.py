@@ -1,107 +1,433 @@
 import socket
-import struct
 import random
-import sys
 import os
+import threading
+import argparse
+import time
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
-def main():
-    # 解析命令行参数
-    if len(sys.argv) != 6:
-        print("Usage: python client.py <serverIP> <serverPort> <Lmin> <Lmax> <filename>")
-        return
-    
-    serverIP = sys.argv[1]
-    serverPort = int(sys.argv[2])
-    Lmin = int(sys.argv[3])
-    Lmax = int(sys.argv[4])
-    filename = sys.argv[5]
-    
-    # 读取文件内容
-    try:
-        with open(filename, 'r') as f:
-            content = f.read()
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return
-    
-    # 计算块数和分块
-    blocks = []
-    total_len = len(content)
+import metrics
+from framing import FrameReader, send_frame, HEADER, RESUME
+
+READ_CHUNK = 1 << 20  # 流式模式下预扫描文件时每次读取的字符数
+CHECKPOINT_INTERVAL = 1.0  # 断点续传模式下最多每隔多少秒保存一次检查点
+RETRIES = 5                # 断点续传模式下连接断开后(没有任何进展时)最多连续重连的次数
+RETRY_DELAY = 1.0          # 第一次重连前等待的时间(秒), 之后每次翻倍
+
+log = logging.getLogger('reversetcpclient')
+
+def block_lengths(total_len, Lmin, Lmax, rng=random):#按[Lmin, Lmax]随机生成每块的长度(字符数)
     start = 0
-    
     while start < total_len:
         # 最后一块特殊处理
         if total_len - start <= Lmax:
             block_len = total_len - start
         else:
-            block_len = random.randint(Lmin, Lmax)
-        
+            block_len = rng.randint(Lmin, Lmax)
+
+        yield block_len
+        start += block_len
+
+def split_blocks(content, Lmin, Lmax):#把整个文件内容分块
+    blocks = []
+    start = 0
+    for block_len in block_lengths(len(content), Lmin, Lmax):
         block = content[start:start+block_len]
         blocks.append(block)
         start += block_len
-    
-    N = len(blocks)  # 总块数
-    
+
+    return blocks
+
+# ======================== 流式模式 ========================
+# 不把整个文件读进内存: 先扫描一遍文件得到字符总数, 用固定种子的随机数生成器算出块数N,
+# 传输时用同一个种子重新生成相同的块长度, 边读文件边发送, 应答直接写入输出文件.
+# 文本模式的read(n)按字符读取, 所以分块不会切断UTF-8多字节字符
+def count_chars(filename):
+    total_len = 0
+    with open(filename, 'r') as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            total_len += len(chunk)
+    return total_len
+
+def count_blocks(total_len, Lmin, Lmax, seed):
+    return sum(1 for _ in block_lengths(total_len, Lmin, Lmax, random.Random(seed)))
+
+def stream_blocks(filename, total_len, Lmin, Lmax, seed, first=0):#从第first块开始生成, 之前的块只读取不返回
+    with open(filename, 'r') as f:
+        for i, block_len in enumerate(block_lengths(total_len, Lmin, Lmax, random.Random(seed))):
+            block = f.read(block_len)
+            if i >= first:
+                yield block
+
+def handshake(sock, reader, N):
+    # 发送Initialization报文 (Type=1, N)
+    init_packet = HEADER.pack(1, N)
+    sock.sendall(init_packet)
+
+    # 接收Agree报文 (Type=2)
+    if reader.read_agree() != 2:
+        raise ConnectionError("Protocol error: Expected agree packet")
+
+def send_request(sock, block):
+    # 发送reverseRequest报文 (Type=3, Length, Data), 首部和数据用scatter-gather一起发出
+    send_frame(sock, 3, block.encode('utf-8'))
+
+def recv_answer(reader):
+    # 接收reverseAnswer报文 (Type=4, Length, reverseData)
+    answer_header = reader.read_header()
+    if answer_header is None:
+        raise ConnectionError("Protocol error: Incomplete answer header")
+
+    type_val, length = answer_header#第一个元素是根据H格式解析得到的无符号短整型值，第二个元素是根据I格式解析得到的无符号整型值。
+    if type_val != 4:
+        raise ConnectionError(f"Protocol error: Expected answer packet, got type {type_val}")
+
+    reversed_data = reader.read_exact(length)
+    if reversed_data is None:
+        raise ConnectionError(f"Incomplete data received: expected {length} bytes")
+
+    return str(reversed_data, 'utf-8')
+
+def reverse_stop_and_wait(sock, reader, blocks, on_answer):#发一块等一块
+    for i, block in enumerate(blocks):
+        send_request(sock, block)
+        on_answer(i, recv_answer(reader))
+
+def shutdown_quietly(sock):#关闭socket的两个方向, 对方已经断开时忽略错误
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+def reverse_pipelined(sock, reader, blocks, N, depth, on_answer):
+    # 流水线模式: 发送线程最多让depth个请求同时在途, 当前线程按顺序接收应答.
+    # 服务器按请求顺序处理, TCP保证顺序, 所以第i个应答就是第i块的结果
+    credits = threading.Semaphore(depth)
+    stopped = threading.Event()
+    writer_error = []
+
+    def writer():
+        try:
+            for block in blocks:
+                credits.acquire()
+                if stopped.is_set():
+                    break
+                send_request(sock, block)
+        except Exception as e:
+            writer_error.append(e)
+            shutdown_quietly(sock)#让接收端尽快退出
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+    try:
+        for i in range(N):
+            on_answer(i, recv_answer(reader))
+            credits.release()
+    except BaseException:
+        # 接收出错时让发送线程退出: 设置停止标志并放出足够的credits, 关闭socket打断阻塞中的发送;
+        # 等它结束后关闭块生成器(流式/续传模式下会关闭输入文件), 重连时不遗留线程和文件描述符
+        stopped.set()
+        for _ in range(depth):
+            credits.release()
+        shutdown_quietly(sock)
+        writer_thread.join()
+        if hasattr(blocks, 'close'):
+            blocks.close()
+        if writer_error:
+            raise writer_error[0]
+        raise
+    writer_thread.join()
+    if writer_error:
+        raise writer_error[0]
+
+# ======================== 多连接并行模式 ========================
+# 把块列表按顺序切成M段, 每段用一条独立连接(各自完成Init/Agree握手)并行处理, 最后按原顺序拼接
+def reverse_shard(serverIP, serverPort, shard, depth):
+    reversed_blocks = []
+    on_answer = lambda i, reversed_text: reversed_blocks.append(reversed_text)
+
+    sock = socket.create_connection((serverIP, serverPort))
+    try:
+        reader = FrameReader(sock)
+        handshake(sock, reader, len(shard))
+        if depth > 1:
+            reverse_pipelined(sock, reader, shard, len(shard), depth, on_answer)
+        else:
+            reverse_stop_and_wait(sock, reader, shard, on_answer)
+    finally:
+        sock.close()
+    return reversed_blocks
+
+def reverse_parallel(serverIP, serverPort, blocks, connections, depth):
+    shard_size = max(1, -(-len(blocks) // connections))  # 向上取整; 空文件没有块, 也不建立连接
+    shards = [blocks[i:i + shard_size] for i in range(0, len(blocks), shard_size)]
+    with ThreadPoolExecutor(max_workers=len(shards) or 1) as pool:
+        results = pool.map(lambda shard: reverse_shard(serverIP, serverPort, shard, depth), shards)
+        return [reversed_text for shard_result in results for reversed_text in shard_result]
+
+# ======================== 断点续传模式 ========================
+# 块长度与流式模式一样由固定种子生成, 会话ID、种子和块数在开始时写入检查点文件(<输出文件>.ckpt, JSON),
+# 之后每隔CHECKPOINT_INTERVAL秒记录已写入输出文件的块数和字节数(先fsync输出文件, 再原子地替换检查点).
+# 连接时发送resumeInit(会话ID, N, 起始块号)代替Initialization, 服务器回复resumeAgree后从起始块开始处理.
+# 连接断开时自动重连, 从最后收到应答的块继续; 进程中途退出时, 重新运行同一命令会从检查点继续,
+# 输出文件先截断到检查点记录的长度
+def checkpoint_path(output_filename):
+    return output_filename + ".ckpt"
+
+def save_checkpoint(path, state):#写临时文件再替换, 中途崩溃时不会留下半个检查点
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_checkpoint(path, filename, Lmin, Lmax):#读取检查点; 不存在或与当前的输入文件/参数不符时返回None
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        log.warning("Ignoring unreadable checkpoint %s", path)
+        return None
+    st = os.stat(filename)
+    if (state.get('size'), state.get('mtime'), state.get('Lmin'), state.get('Lmax')) != (st.st_size, st.st_mtime, Lmin, Lmax):
+        log.warning("Checkpoint %s does not match %s, starting over", path, filename)
+        return None
+    return state
+
+def new_transfer(filename, Lmin, Lmax):#新传输的检查点内容: 会话ID、分块参数和进度
+    st = os.stat(filename)
+    seed = random.getrandbits(64)
+    total_len = count_chars(filename)
+    return {
+        'transfer_id': os.urandom(RESUME.size - 8).hex(),  # 16字节随机会话ID
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'Lmin': Lmin,
+        'Lmax': Lmax,
+        'seed': seed,
+        'total_len': total_len,
+        'N': count_blocks(total_len, Lmin, Lmax, seed),
+        'done': 0,        # 已写入输出文件的块数
+        'out_bytes': 0,   # 输出文件中有效数据的字节数
+    }
+
+def resume_handshake(sock, reader, transfer_id, N, first):#发送resumeInit, 等待服务器同意从第first块开始
+    send_frame(sock, 5, RESUME.pack(transfer_id, N, first))
+
+    # 接收resumeAgree报文 (Type=6); 服务器拒绝时直接关闭连接
+    frame = reader.read_frame()
+    if frame is None:
+        raise ConnectionError("Server rejected resume request")
+    type_val, payload = frame
+    if type_val != 6 or len(payload) != RESUME.size:
+        raise ConnectionError(f"Protocol error: Expected resume agree packet, got type {type_val}")
+    agreed_id, agreed_N, agreed_first = RESUME.unpack(payload)
+    if (agreed_id, agreed_N, agreed_first) != (transfer_id, N, first):
+        raise ConnectionError("Protocol error: resume agree does not match request")
+
+def run_resumable(args, output_filename):
+    path = checkpoint_path(output_filename)
+    state = load_checkpoint(path, args.filename, args.Lmin, args.Lmax)
+    if state is not None and not (os.path.exists(output_filename) and os.path.getsize(output_filename) >= state['out_bytes']):
+        # 输出文件被删除或比检查点记录的短: 已完成的块不在文件里了, 只能从头开始
+        log.warning("Output %s is missing or shorter than checkpoint %s, starting over", output_filename, path)
+        state = None
+    if state is None:
+        state = new_transfer(args.filename, args.Lmin, args.Lmax)
+        save_checkpoint(path, state)
+        output_file = open(output_filename, 'wb')
+    else:
+        log.info("Resuming transfer %s at block %d of %d", state['transfer_id'], state['done'], state['N'])
+        output_file = open(output_filename, 'r+b')
+        output_file.truncate(state['out_bytes'])
+        output_file.seek(state['out_bytes'])
+
+    transfer_id = bytes.fromhex(state['transfer_id'])
+    N = state['N']
+    last_saved = time.monotonic()
+
+    def checkpoint():
+        nonlocal last_saved
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        save_checkpoint(path, state)
+        last_saved = time.monotonic()
+
+    def on_answer(i, reversed_text):
+        data = reversed_text.encode('utf-8')
+        output_file.write(data)
+        state['done'] += 1
+        state['out_bytes'] += len(data)
+        if time.monotonic() - last_saved >= CHECKPOINT_INTERVAL:
+            checkpoint()
+
+    start_time = time.perf_counter()
+    failures = 0
+    try:
+        while state['done'] < N:
+            first = state['done']
+            try:
+                sock = socket.create_connection((args.serverIP, args.serverPort))
+                try:
+                    reader = FrameReader(sock)
+                    resume_handshake(sock, reader, transfer_id, N, first)
+                    blocks = stream_blocks(args.filename, state['total_len'], args.Lmin, args.Lmax, state['seed'], first)
+                    if args.pipeline > 1:
+                        reverse_pipelined(sock, reader, blocks, N - first, args.pipeline, on_answer)
+                    else:
+                        reverse_stop_and_wait(sock, reader, blocks, on_answer)
+                finally:
+                    sock.close()
+            except OSError as e:
+                checkpoint()
+                failures = 0 if state['done'] > first else failures + 1
+                if failures >= args.retries:
+                    raise
+                delay = RETRY_DELAY * 2 ** failures
+                log.warning("Connection lost at block %d of %d (%s), reconnecting in %.0f s",
+                            state['done'], N, e, delay)
+                time.sleep(delay)
+    finally:
+        if state['done'] < N:
+            # 出错退出时保存进度, 重新运行同一命令即可继续
+            checkpoint()
+            log.info("Progress saved in %s (%d of %d blocks)", path, state['done'], N)
+        output_file.close()
+
+    os.remove(path)
+    log.info("Final reversed file saved as: %s (%d blocks)", output_filename, N)
+    report_throughput(args.filename, start_time)
+
+def report_throughput(filename, start_time):#按输入文件大小计算总吞吐量
+    elapsed = time.perf_counter() - start_time
+    mb = os.path.getsize(filename) / 1e6
+    log.info("Transferred %.2f MB in %.2f s (%.2f MB/s)", mb, elapsed, mb / elapsed)
+
+def main():
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(usage="python client.py <serverIP> <serverPort> <Lmin> <Lmax> <filename> [--pipeline K] [--stream | --connections M | --resume [--retries R]] [--verbose]")
+    parser.add_argument("serverIP")
+    parser.add_argument("serverPort", type=int)
+    parser.add_argument("Lmin", type=int)
+    parser.add_argument("Lmax", type=int)
+    parser.add_argument("filename")
+    parser.add_argument("--pipeline", type=int, default=1, metavar="K",
+                        help="最多同时在途的reverseRequest数, 1表示发一块等一块")
+    parser.add_argument("--stream", action="store_true",
+                        help="流式模式: 边读文件边发送, 应答直接写入输出文件, 内存占用与文件大小无关")
+    parser.add_argument("--connections", type=int, default=1, metavar="M",
+                        help="把块分成M段, 用M条连接并行处理 (不能与--stream同时使用)")
+    parser.add_argument("--resume", action="store_true",
+                        help="断点续传模式(流式读取): 进度保存在检查点文件中, 连接断开时自动重连, 重新运行同一命令从检查点继续")
+    parser.add_argument("--retries", type=int, default=RETRIES,
+                        help="断点续传模式下连接断开后没有任何进展时最多连续重连的次数")
+    parser.add_argument("-v", "--verbose", action="store_true", help="逐块输出反转结果(流式模式下不输出)")
+    args = parser.parse_args()
+    if args.connections > 1 and args.stream:
+        parser.error("--connections cannot be combined with --stream")
+    if args.connections > 1 and args.resume:
+        parser.error("--connections cannot be combined with --resume")
+
+    listener = metrics.setup_logging(args.verbose)
+    try:
+        run(args)
+    finally:
+        listener.stop()
+
+def run(args):#按命令行参数完成一次文件反转
+    serverIP = args.serverIP
+    serverPort = args.serverPort
+    Lmin = args.Lmin
+    Lmax = args.Lmax
+    filename = args.filename
+    output_filename = os.path.splitext(filename)[0] + "_reversed.txt"
+
+    if args.resume:
+        try:
+            run_resumable(args, output_filename)
+        except Exception as e:
+            log.error("Error: %s", e)
+        return
+
+    # 读取文件内容, 计算块数和分块
+    try:
+        if args.stream:
+            seed = random.getrandbits(64)
+            total_len = count_chars(filename)
+            N = count_blocks(total_len, Lmin, Lmax, seed)
+            blocks = stream_blocks(filename, total_len, Lmin, Lmax, seed)
+        else:
+            with open(filename, 'r') as f:
+                content = f.read()
+            blocks = split_blocks(content, Lmin, Lmax)
+            N = len(blocks)  # 总块数
+    except Exception as e:
+        log.error("Error reading file: %s", e)
+        return
+
+    start_time = time.perf_counter()
+    if args.connections > 1:
+        try:
+            reversed_blocks = reverse_parallel(serverIP, serverPort, blocks, args.connections, args.pipeline)
+            for i, reversed_text in enumerate(reversed_blocks):
+                log.debug("第 %d 块: %s", i + 1, reversed_text)
+            with open(output_filename, 'w') as f:
+                f.write("".join(reversed_blocks))
+            log.info("Final reversed file saved as: %s (%d blocks)", output_filename, N)
+            report_throughput(filename, start_time)
+        except Exception as e:
+            log.error("Error: %s", e)
+        return
+
     # 连接服务器
+    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)#AF_IENT表示使用IPv4地址, SOCK_STREAM表示使用TCP协议
+    output_file = None
     try:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)#AF_IENT表示使用IPv4地址, SOCK_STREAM表示使用TCP协议
         client_socket.connect((serverIP, serverPort))
-        
-        # 发送Initialization报文 (Type=1, N)
-        init_packet = struct.pack('>HI', 1, N)
-        client_socket.sendall(init_packet)
-        
-        # 接收Agree报文 (Type=2)
-        agree_packet = client_socket.recv(2)#参数为最多接收的字节数
-        if len(agree_packet) < 2 or struct.unpack('>H', agree_packet)[0] != 2:
-            print("Protocol error: Expected agree packet")
-            return
-        
+        reader = FrameReader(client_socket)
+        handshake(client_socket, reader, N)
+
         # 发送和接收所有块
-        reversed_content = ""
-        for i, block in enumerate(blocks):
-            # 发送reverseRequest报文 (Type=3, Length, Data)
-            data = block.encode('utf-8')
-            request_header = struct.pack('>HI', 3, len(data))
-            client_socket.sendall(request_header + data)
-            
-            # 接收reverseAnswer报文 (Type=4, Length, reverseData)
-            answer_header = client_socket.recv(6)
-            if len(answer_header) < 6:
-                print("Protocol error: Incomplete answer header")
-                break
-                
-            type_val, length = struct.unpack('>HI', answer_header)#第一个元素是根据H格式解析得到的无符号短整型值，第二个元素是根据I格式解析得到的无符号整型值。
-            if type_val != 4:
-                print(f"Protocol error: Expected answer packet, got type {type_val}")
-                break
-                
-            reversed_data = b''
-            while len(reversed_data) < length:
-                chunk = client_socket.recv(length - len(reversed_data))
-                if not chunk:
-                    break
-                reversed_data += chunk
-                
-            if len(reversed_data) != length:
-                print(f"Incomplete data received: expected {length}, got {len(reversed_data)}")
-                break
-                
-            # 处理反转数据
-            reversed_text = reversed_data.decode('utf-8')
-            reversed_content += reversed_text
-            print(f"第 {i+1} 块: {reversed_text}")
-        
+        if args.stream:
+            output_file = open(output_filename, 'w')
+
+            def on_answer(i, reversed_text):
+                output_file.write(reversed_text)
+        else:
+            reversed_blocks = []
+
+            def on_answer(i, reversed_text):
+                # 处理反转数据
+                reversed_blocks.append(reversed_text)
+                log.debug("第 %d 块: %s", i + 1, reversed_text)
+
+        if args.pipeline > 1:
+            reverse_pipelined(client_socket, reader, blocks, N, args.pipeline, on_answer)
+        else:
+            reverse_stop_and_wait(client_socket, reader, blocks, on_answer)
+
         # 保存最终反转文件
-        output_filename = os.path.splitext(filename)[0] + "_reversed.txt"
-        with open(output_filename, 'w') as f:
-            f.write(reversed_content)
-        print(f"Final reversed file saved as: {output_filename}")
-            
+        if not args.stream:
+            reversed_content = "".join(reversed_blocks)
+            with open(output_filename, 'w') as f:
+                f.write(reversed_content)
+        log.info("Final reversed file saved as: %s (%d blocks)", output_filename, N)
+        report_throughput(filename, start_time)
+
     except Exception as e:
-        print(f"Error: {e}")
+        log.error("Error: %s", e)
     finally:
+        if output_file is not None:
+            output_file.close()
         client_socket.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,78 +1,174 @@
 import socket
-import struct
 import threading
+import asyncio
+import argparse
+import multiprocessing
+import signal
+import os
+import time
+import logging
+
+import metrics
+from framing import FrameReader, send_frame, HEADER, AGREE, RESUME
+from reverse_engine import reverse_utf8
+
+# ======================== 服务器配置参数 ========================
+HOST = "172.27.169.160"
+PORT = 8888
+MAX_CONNECTIONS = 1000  # 事件循环模式下允许的最大并发连接数
+SHUTDOWN_GRACE = 5.0    # 优雅退出时等待已有连接处理完毕的最长时间(秒)
+STATS_INTERVAL = 0      # 每隔多少秒输出一行统计信息, 0表示只在退出和收到SIGUSR1时输出
+SESSION_TTL = 3600      # 断点续传会话多久没有进展就从会话表中清除(秒)
+
+# 本进程的统计信息, 多进程模式下每个worker各有一份; 线程模式下由stats_lock保护
+stats = {
+    'connections': 0,   # 已接受的连接数
+    'rejected': 0,      # 因超过最大连接数被拒绝的连接数
+    'errors': 0,        # 协议错误、数据不完整或连接异常的次数
+    'resumed': 0,       # 以resumeInit开始的连接数
+    'active': 0,        # 当前活动连接数
+    'blocks': 0,        # 已反转的块数
+    'bytes_in': 0,      # 收到的数据字节数
+    'bytes_out': 0,     # 发出的数据字节数
+}
+histograms = {
+    'block_bytes': metrics.Histogram(),  # 每块的数据长度(字节)
+    'service_us': metrics.Histogram(),   # 每块从收齐数据到发出应答的时间(微秒)
+}
+stats_lock = threading.Lock()
+log = logging.getLogger('reversetcpserver')
+
+# ======================== 断点续传会话 ========================
+# 客户端用resumeInit(会话ID, 总块数N, 起始块号)代替Initialization, 服务器用resumeAgree回复同意的起始块号,
+# 然后从该块开始处理到第N块. 反转只依赖块本身, 服务器不需要记录处理到哪一块, 起始块号总是按客户端的检查点接受.
+# 每个进程各有一份会话表, 只记录每个会话的N, 用来拒绝同一会话ID但N不同的请求; 表项在每次resumeInit时刷新,
+# SESSION_TTL秒内没有再次续传就被清除. 服务器不知道的会话(新的传输、已过期、服务器重启过或prefork模式下
+# 落到了别的worker)同样接受
+sessions = {}  # 会话ID -> {'N': 总块数, 'expires': 过期时间}
+sessions_lock = threading.Lock()
+
+def open_session(payload):#处理resumeInit的数据部分, 返回(会话ID, N, 起始块号); 格式错误或与会话表矛盾时返回None
+    if payload is None or len(payload) != RESUME.size:
+        return None
+    transfer_id, N, first = RESUME.unpack(payload)
+    if first > N:
+        return None
+    now = time.time()
+    with sessions_lock:
+        for key in [key for key, session in sessions.items() if session['expires'] < now]:
+            del sessions[key]
+        session = sessions.get(transfer_id)
+        if session is not None and session['N'] != N:
+            return None
+        sessions[transfer_id] = {'N': N, 'expires': now + SESSION_TTL}
+    count_stat('resumed')
+    return transfer_id, N, first
+
+def reverse_data(data):#反转一个块, 线程模式和事件循环模式共用
+    return reverse_utf8(data)
+
+def record_block(length, out_len, started):#统计一个已应答的块, started为收齐数据时的perf_counter()
+    elapsed_us = int((time.perf_counter() - started) * 1e6)
+    with stats_lock:
+        stats['blocks'] += 1
+        stats['bytes_in'] += length
+        stats['bytes_out'] += out_len
+        histograms['block_bytes'].add(length)
+        histograms['service_us'].add(elapsed_us)
+
+def count_stat(name, n=1):
+    with stats_lock:
+        stats[name] += n
 
 def handle_client(conn, addr):
-    print(f"New connection from: {addr}")
-    
+    log.debug("New connection from: %s", addr)
+    count_stat('connections')
+    count_stat('active')
+    reader = FrameReader(conn)#每个连接一个预分配的接收缓冲区
+
     try:
         # 接收Initialization报文
-        init_packet = conn.recv(6)
-        if len(init_packet) < 6:
-            print("Incomplete initialization packet")
+        init_header = reader.read_header()
+        if init_header is None:
+            log.warning("Incomplete initialization packet")
+            count_stat('errors')
             return
-            
-        type_val, N = struct.unpack('>HI', init_packet)
-        if type_val != 1:
-            print(f"Protocol error: Expected init packet, got type {type_val}")
+
+        type_val, N = init_header
+        first = 0
+        if type_val == 5:
+            # resumeInit报文: 首部的长度字段之后是会话ID、总块数和起始块号
+            resume = open_session(reader.read_exact(N) if N == RESUME.size else None)
+            if resume is None:
+                log.warning("Rejected resume request from %s", addr)
+                count_stat('errors')
+                return
+            transfer_id, N, first = resume
+            log.debug("Client resumed transfer %s at block %d of %d", transfer_id.hex(), first, N)
+
+            # 发送resumeAgree报文
+            send_frame(conn, 6, RESUME.pack(transfer_id, N, first))
+        elif type_val != 1:
+            log.warning("Protocol error: Expected init packet, got type %d", type_val)
+            count_stat('errors')
             return
-            
-        print(f"Client requested to reverse {N} blocks")
-        
-        # 发送Agree报文
-        agree_packet = struct.pack('>H', 2)
-        conn.sendall(agree_packet)
-        
-        # 处理所有块
-        for i in range(N):
+        else:
+            log.debug("Client requested to reverse %d blocks", N)
+
+            # 发送Agree报文
+            agree_packet = AGREE.pack(2)
+            conn.sendall(agree_packet)
+
+        # 处理所有块(续传时从起始块开始)
+        for i in range(first, N):
             # 接收reverseRequest报文
-            request_header = conn.recv(6)
-            if len(request_header) < 6:
-                print("Incomplete request header")
+            request_header = reader.read_header()
+            if request_header is None:
+                log.warning("Incomplete request header")
+                count_stat('errors')
                 break
-                
-            type_val, length = struct.unpack('>HI', request_header)
+
+            type_val, length = request_header
             if type_val != 3:
-                print(f"Protocol error: Expected request packet, got type {type_val}")
+                log.warning("Protocol error: Expected request packet, got type %d", type_val)
+                count_stat('errors')
                 break
-                
-            # 接收数据
-            data = b''
-            while len(data) < length:#使用循环是因为确保在处理数据之前已经完整地接收到了所有内容，避免因数据不完整导致的处理错误
-                chunk = conn.recv(length - len(data))
-                if not chunk:
-                    break
-                data += chunk
-                
-            if len(data) != length:
-                print(f"Incomplete data: expected {length}, got {len(data)}")
+
+            # 接收数据, 数据不完整时不处理
+            data = reader.read_exact(length)
+            if data is None:
+                log.warning("Incomplete data: expected %d bytes", length)
+                count_stat('errors')
                 break
-                
+            started = time.perf_counter()
+
             # 反转数据
-            text = data.decode('utf-8')
-            reversed_text = text[::-1]
-            reversed_data = reversed_text.encode('utf-8')
-            
+            reversed_data = reverse_data(data)
+
             # 发送reverseAnswer报文
-            answer_header = struct.pack('>HI', 4, len(reversed_data))
-            conn.sendall(answer_header + reversed_data)
-            
-        print(f"Finished processing {addr}")
-        
+            send_frame(conn, 4, reversed_data)
+            record_block(length, len(reversed_data), started)
+
+        log.debug("Finished processing %s", addr)
+
     except Exception as e:
-        print(f"Error with {addr}: {e}")
+        log.warning("Error with %s: %s", addr, e)
+        count_stat('errors')
     finally:
+        count_stat('active', -1)
         conn.close()
 
-def main():
+def serve_threaded(host, port, stats_interval=STATS_INTERVAL):#每个连接一个线程
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)#允许地址重用
-    
+
     try:
-        server_socket.bind(("172.27.169.160", 8888))
+        server_socket.bind((host, port))
         server_socket.listen(5)
-        print("Server started, waiting for connections...")
-        
+        log.info("Server started, waiting for connections...")
+        if stats_interval > 0:
+            metrics.start_reporter(lambda: dump_stats(0), stats_interval)
+
         while True:
             conn, addr = server_socket.accept()
             client_thread = threading.Thread(
@@ -81,11 +177,247 @@ def main():
             )
             client_thread.daemon = True# 将线程设置为守护线程（daemon thread）
             client_thread.start()
-            
+
     except Exception as e:
-        print(f"Server error: {e}")
+        log.error("Server error: %s", e)
     finally:
         server_socket.close()
+        dump_stats(0)
+
+# ======================== 事件循环模式 ========================
+# 单进程单线程, 用asyncio流处理所有连接, 报文格式与线程模式完全相同
+
+async def handle_client_async(reader, writer, slots):
+    addr = writer.get_extra_info('peername')
+
+    # 超过最大连接数时直接关闭新连接
+    if slots.locked():
+        log.debug("Too many connections, rejecting %s", addr)
+        count_stat('rejected')
+        writer.close()
+        return
+
+    async with slots:
+        log.debug("New connection from: %s", addr)
+        count_stat('connections')
+        count_stat('active')
+        try:
+            # 接收Initialization报文
+            try:
+                init_packet = await reader.readexactly(HEADER.size)
+            except asyncio.IncompleteReadError:
+                log.warning("Incomplete initialization packet")
+                count_stat('errors')
+                return
+
+            type_val, N = HEADER.unpack(init_packet)
+            first = 0
+            if type_val == 5:
+                # resumeInit报文: 首部的长度字段之后是会话ID、总块数和起始块号
+                try:
+                    payload = await reader.readexactly(N) if N == RESUME.size else None
+                except asyncio.IncompleteReadError:
+                    payload = None
+                resume = open_session(payload)
+                if resume is None:
+                    log.warning("Rejected resume request from %s", addr)
+                    count_stat('errors')
+                    return
+                transfer_id, N, first = resume
+                log.debug("Client resumed transfer %s at block %d of %d", transfer_id.hex(), first, N)
+
+                # 发送resumeAgree报文
+                writer.writelines((HEADER.pack(6, RESUME.size), RESUME.pack(transfer_id, N, first)))
+            elif type_val != 1:
+                log.warning("Protocol error: Expected init packet, got type %d", type_val)
+                count_stat('errors')
+                return
+            else:
+                log.debug("Client requested to reverse %d blocks", N)
+
+                # 发送Agree报文
+                writer.write(AGREE.pack(2))
+
+            # 处理所有块(续传时从起始块开始)
+            for i in range(first, N):
+                # 接收reverseRequest报文
+                try:
+                    request_header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    log.warning("Incomplete request header")
+                    count_stat('errors')
+                    break
+
+                type_val, length = HEADER.unpack(request_header)
+                if type_val != 3:
+                    log.warning("Protocol error: Expected request packet, got type %d", type_val)
+                    count_stat('errors')
+                    break
+
+                # 接收数据
+                try:
+                    data = await reader.readexactly(length)
+                except asyncio.IncompleteReadError as e:
+                    log.warning("Incomplete data: expected %d, got %d", length, len(e.partial))
+                    count_stat('errors')
+                    break
+                started = time.perf_counter()
+
+                # 反转数据并发送reverseAnswer报文
+                reversed_data = reverse_data(data)
+                writer.writelines((HEADER.pack(4, len(reversed_data)), reversed_data))
+                await writer.drain()#发送缓冲区满时等待, 防止内存无限增长
+                record_block(length, len(reversed_data), started)
+
+            log.debug("Finished processing %s", addr)
+
+        except Exception as e:
+            log.warning("Error with %s: %s", addr, e)
+            count_stat('errors')
+        finally:
+            count_stat('active', -1)
+            writer.close()
+
+def dump_stats(worker_id):
+    with stats_lock:
+        counters = " ".join(f"{name}={value}" for name, value in stats.items())
+        block_bytes = histograms['block_bytes'].format()
+        service_us = histograms['service_us'].format()
+    log.info("[worker %d pid %d] %s block_bytes[%s] service_us[%s]",
+             worker_id, os.getpid(), counters, block_bytes, service_us)
+
+async def report_stats(interval, worker_id):#事件循环模式的定期统计, 在事件循环中运行, 不另开线程
+    while True:
+        await asyncio.sleep(interval)
+        dump_stats(worker_id)
+
+async def serve_async(host, port, max_connections, sock=None, reuse_port=False, worker_id=0,
+                      stats_interval=STATS_INTERVAL):
+    slots = asyncio.Semaphore(max_connections)
+    handler = lambda r, w: handle_client_async(r, w, slots)
+    if sock is not None:
+        # 使用父进程继承来的监听socket
+        server = await asyncio.start_server(handler, sock=sock, backlog=max(100, max_connections))
+    else:
+        server = await asyncio.start_server(
+            handler, host, port,
+            reuse_address=True,
+            reuse_port=reuse_port or None,
+            backlog=max(100, max_connections)
+        )
+    log.info("Server started (asyncio, max %d connections), waiting for connections...", max_connections)
+    reporter = asyncio.ensure_future(report_stats(stats_interval, worker_id)) if stats_interval > 0 else None
+
+    # SIGTERM/SIGINT: 停止接受新连接, 等待已有连接处理完毕; SIGUSR1: 打印统计信息
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+        loop.add_signal_handler(signal.SIGINT, stop_event.set)
+        if hasattr(signal, 'SIGUSR1'):
+            loop.add_signal_handler(signal.SIGUSR1, dump_stats, worker_id)
+    except NotImplementedError:
+        pass  # Windows不支持add_signal_handler, 只能用Ctrl+C退出
+
+    try:
+        await stop_event.wait()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        server.close()
+        deadline = loop.time() + SHUTDOWN_GRACE
+        while stats['active'] > 0 and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        dump_stats(worker_id)
+
+# ======================== 多进程(pre-fork)模式 ========================
+# N个worker进程各自运行一个事件循环. 支持SO_REUSEPORT时每个worker单独绑定端口,
+# 由内核把连接分散到各个进程; 否则父进程先创建监听socket, 由worker继承
+def run_worker(worker_id, host, port, max_connections, sock, verbose, stats_interval):
+    # 日志队列的后台线程不会随fork复制到子进程, 每个worker重新配置自己的日志输出
+    listener = metrics.setup_logging(verbose)
+    try:
+        asyncio.run(serve_async(host, port, max_connections, sock=sock,
+                                reuse_port=sock is None, worker_id=worker_id, stats_interval=stats_interval))
+    except KeyboardInterrupt:
+        dump_stats(worker_id)
+    except Exception as e:
+        log.error("[worker %d] Server error: %s", worker_id, e)
+    finally:
+        listener.stop()
+
+def raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def serve_prefork(host, port, max_connections, workers, verbose=False, stats_interval=STATS_INTERVAL):
+    listen_sock = None
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_sock.bind((host, port))
+        listen_sock.listen(max(100, max_connections))
+
+    procs = []
+    for i in range(workers):
+        p = multiprocessing.Process(target=run_worker,
+                                    args=(i, host, port, max_connections, listen_sock, verbose, stats_interval))
+        p.start()
+        procs.append(p)
+    log.info("Started %d worker processes (%s)", workers,
+             'SO_REUSEPORT' if listen_sock is None else 'shared listening socket')
+
+    # 父进程收到SIGTERM时也走KeyboardInterrupt的清理流程
+    signal.signal(signal.SIGTERM, raise_interrupt)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        log.info("Shutting down workers...")
+    finally:
+        # 通知所有worker优雅退出, 超时仍未退出的强制结束
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join(SHUTDOWN_GRACE + 1)
+            if p.is_alive():
+                p.kill()
+        if listen_sock is not None:
+            listen_sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Reverse TCP server")
+    parser.add_argument("--mode", choices=["threaded", "async", "prefork"], default="threaded",
+                        help="threaded: 每个连接一个线程; async: 单线程事件循环; prefork: 多个事件循环worker进程")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-conns", type=int, default=MAX_CONNECTIONS,
+                        help="事件循环模式下(每个worker)的最大并发连接数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="prefork模式下的worker进程数")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每个连接的建立/结束日志")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help="每隔多少秒输出一行统计信息(每个worker各一行), 0表示不输出")
+    args = parser.parse_args()
+
+    listener = metrics.setup_logging(args.verbose)
+    try:
+        if args.mode == "prefork":
+            serve_prefork(args.host, args.port, args.max_conns, args.workers, args.verbose, args.stats_interval)
+        elif args.mode == "async":
+            try:
+                asyncio.run(serve_async(args.host, args.port, args.max_conns, stats_interval=args.stats_interval))
+            except KeyboardInterrupt:
+                pass
+            except Exception as e:
+                log.error("Server error: %s", e)
+        else:
+            try:
+                serve_threaded(args.host, args.port, args.stats_interval)
+            except KeyboardInterrupt:
+                pass
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
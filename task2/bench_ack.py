@@ -0,0 +1,47 @@
+import os
+import contextlib
+import argparse
+
+import udpclient
+from bench_arq import free_port, start_server
+
+# 服务器不同ACK策略的对比: 反向链路的ACK包数和完成时间
+# 策略写作 N/延迟毫秒, 如 1/0 为每个包立即确认(原来的行为), 2/20 为每2个包或20ms确认一次
+
+def run_once(loss_rate, mode, ack_every, ack_delay_ms, **client_kwargs):
+    port = free_port()
+    proc = start_server(port, loss_rate, ("--ack-every", str(ack_every), "--ack-delay", str(ack_delay_ms)))
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return udpclient.main("127.0.0.1", port, mode, **client_kwargs)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Delayed/cumulative ACK policies: reverse-path packets vs completion time")
+    parser.add_argument("--policies", default="1/0,2/20,4/20,8/20", help="ACK策略列表, 每项为 N/延迟毫秒")
+    parser.add_argument("--loss-rates", default="0,0.1")
+    parser.add_argument("--modes", default="gbn,sr")
+    parser.add_argument("--cc", default="reno", help="拥塞控制算法: fixed, reno, cubic")
+    parser.add_argument("--count", type=int, default=1000, help="每次发送的数据包数")
+    parser.add_argument("--packet-size", type=int, default=udpclient.PACKET_SIZE)
+    parser.add_argument("--runs", type=int, default=3, help="每种配置重复次数, 取平均")
+    args = parser.parse_args()
+
+    policies = [tuple(p.split("/")) for p in args.policies.split(",")]
+    print(f"{'loss':>6}{'mode':>6}{'policy':>9}{'acks':>9}{'acks/pkt':>10}{'sends':>9}{'time(s)':>9}")
+    for loss_rate in (float(x) for x in args.loss_rates.split(",")):
+        for mode in args.modes.split(","):
+            for ack_every, ack_delay in policies:
+                results = [run_once(loss_rate, mode, int(ack_every), float(ack_delay), cc_algorithm=args.cc,
+                                    count=args.count, packet_size=args.packet_size) for _ in range(args.runs)]
+                results = [r for r in results if r]
+                acks = sum(r['acks_received'] for r in results) / len(results)
+                sends = sum(r['total_send_num'] for r in results) / len(results)
+                elapsed = sum(r['elapsed'] for r in results) / len(results)
+                print(f"{loss_rate:>6.2f}{mode:>6}{ack_every + '/' + ack_delay:>9}{acks:>9.0f}"
+                      f"{acks / args.count:>10.2f}{sends:>9.0f}{elapsed:>9.2f}")
+
+if __name__ == "__main__":
+    main()
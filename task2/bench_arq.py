@@ -0,0 +1,65 @@
+import socket
+import subprocess
+import sys
+import os
+import time
+import contextlib
+import argparse
+
+import udpclient
+
+# 不同丢包率下对比 GBN/SR 以及固定/自适应RTO: 总发送数(含重传)和完成时间
+# 每次运行都启动一个新的服务器进程, 客户端在本进程中运行, 其输出被丢弃
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "udpserver.py")
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def start_server(port, loss_rate, extra_args=()):
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--host", "127.0.0.1", "--port", str(port), "--loss", str(loss_rate), *extra_args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    time.sleep(0.3)  # 等待服务器绑定端口
+    return proc
+
+def run_once(loss_rate, mode, **client_kwargs):
+    port = free_port()
+    proc = start_server(port, loss_rate)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return udpclient.main("127.0.0.1", port, mode, **client_kwargs)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="GBN vs SR under simulated loss")
+    parser.add_argument("--loss-rates", default="0.1,0.2,0.3,0.5")
+    parser.add_argument("--modes", default="gbn,sr")
+    parser.add_argument("--rto", default="adaptive", help="RTO模式列表, 如 fixed,adaptive")
+    parser.add_argument("--cc", default="fixed", help="拥塞控制算法: fixed, reno, cubic")
+    parser.add_argument("--count", type=int, default=udpclient.TOTAL_PACKETS_TO_SEND, help="每次发送的数据包数")
+    parser.add_argument("--runs", type=int, default=3, help="每种配置重复次数, 取平均")
+    args = parser.parse_args()
+
+    modes = [(m, r) for m in args.modes.split(",") for r in args.rto.split(",")]
+    print(f"{'loss':>6}" + "".join(f"{m.upper() + '/' + r + ' sends':>22}{'time(s)':>9}" for m, r in modes))
+    for loss_rate in (float(x) for x in args.loss_rates.split(",")):
+        row = f"{loss_rate:>6.2f}"
+        for mode, rto_mode in modes:
+            results = [run_once(loss_rate, mode, rto_mode=rto_mode,
+                                cc_algorithm=args.cc, count=args.count) for _ in range(args.runs)]
+            results = [r for r in results if r]
+            sends = sum(r['total_send_num'] for r in results) / len(results)
+            elapsed = sum(r['elapsed'] for r in results) / len(results)
+            row += f"{sends:>22.1f}{elapsed:>9.2f}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+
+import udpclient
+from bench_arq import run_once
+
+# 快速重传与只靠超时重传的对比: 完成时间、超时次数(每次超时发送端都停顿一个RTO)、快速重传次数和总发送数
+# 阈值0表示关闭快速重传, 3为默认的三次重复ACK
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast retransmit vs timeout-only recovery under simulated loss")
+    parser.add_argument("--loss-rates", default="0.3")
+    parser.add_argument("--modes", default="gbn,sr")
+    parser.add_argument("--dupacks", default=f"0,{udpclient.DUP_ACK_THRESHOLD}", help="重复ACK阈值列表, 0为只靠超时")
+    parser.add_argument("--cc", default="reno", help="拥塞控制算法: fixed, reno, cubic")
+    parser.add_argument("--count", type=int, default=1000, help="每次发送的数据包数")
+    parser.add_argument("--runs", type=int, default=3, help="每种配置重复次数, 取平均")
+    args = parser.parse_args()
+
+    print(f"{'loss':>6}{'mode':>6}{'dupack':>8}{'timeouts':>10}{'fast rtx':>10}{'sends':>9}{'time(s)':>9}")
+    for loss_rate in (float(x) for x in args.loss_rates.split(",")):
+        for mode in args.modes.split(","):
+            for threshold in (int(x) for x in args.dupacks.split(",")):
+                results = [run_once(loss_rate, mode, cc_algorithm=args.cc, count=args.count, dup_threshold=threshold)
+                           for _ in range(args.runs)]
+                results = [r for r in results if r]
+                timeouts = sum(r['timeouts'] for r in results) / len(results)
+                fast = sum(r['fast_retransmits'] for r in results) / len(results)
+                sends = sum(r['total_send_num'] for r in results) / len(results)
+                elapsed = sum(r['elapsed'] for r in results) / len(results)
+                print(f"{loss_rate:>6.2f}{mode:>6}{threshold:>8}{timeouts:>10.1f}{fast:>10.1f}{sends:>9.0f}{elapsed:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import contextlib
+import argparse
+
+import udpclient
+from bench_arq import free_port, start_server
+
+# 回环地址上的吞吐量: 不丢包, 比较每次只收发一个数据报(--batch 1)和批量收发,
+# 以及80字节和MTU大小的数据长度. 输出 包/秒 和 MB/秒(只计数据部分)
+# 客户端在本进程中运行, 没有配置日志输出, 逐包的DEBUG日志在级别检查处直接返回, 不产生格式化开销
+
+def run_once(packet_size, batch, count, cc_algorithm):
+    port = free_port()
+    proc = start_server(port, 0.0, ("--batch", str(batch)))
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return udpclient.main("127.0.0.1", port, "sr", "adaptive", cc_algorithm, count, packet_size, batch)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP transfer throughput on loopback")
+    parser.add_argument("--sizes", default=f"{udpclient.PACKET_SIZE},{udpclient.MTU_PAYLOAD}", help="数据长度列表(字节)")
+    parser.add_argument("--batches", default=f"1,{udpclient.RECV_BATCH}", help="每次唤醒最多收取的数据报数列表")
+    parser.add_argument("--count", type=int, default=20000, help="每次发送的数据包数")
+    parser.add_argument("--cc", default="reno", help="拥塞控制算法: fixed, reno, cubic")
+    parser.add_argument("--runs", type=int, default=3, help="每种配置重复次数, 取最好的一次")
+    args = parser.parse_args()
+
+    print(f"{'size':>6}{'batch':>7}{'pkts/s':>12}{'MB/s':>9}{'sends':>9}")
+    for size in (int(x) for x in args.sizes.split(",")):
+        for batch in (int(x) for x in args.batches.split(",")):
+            results = [run_once(size, batch, args.count, args.cc) for _ in range(args.runs)]
+            best = min((r for r in results if r), key=lambda r: r['elapsed'])
+            pps = args.count / best['elapsed']
+            mbps = best['bytes_sent'] / best['elapsed'] / 1e6
+            print(f"{size:>6}{batch:>7}{pps:>12.0f}{mbps:>9.2f}{best['total_send_num']:>9}")
+
+if __name__ == "__main__":
+    main()
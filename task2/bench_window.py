@@ -0,0 +1,86 @@
+import os
+import time
+import contextlib
+import tracemalloc
+import argparse
+
+import udpclient
+import sendwindow
+from bench_arq import free_port, start_server
+
+# 大窗口下发送端的开销: 固定窗口(--cc fixed), 窗口为 N 个包, 不丢包, 输出 包/秒、总发送数和完成时间
+# 另外单独测未确认包的存储本身: 放入N个包, 再每ack_step个包一次累计确认直到全部释放, 输出耗时和内存峰值,
+# 对比环形发送窗口(sendwindow.py)和原来每个包一个字典、每次累计确认都扫描全部未确认包的表示
+# 客户端在本进程中运行, 其输出被丢弃
+
+def run_once(window_packets, packet_size, count, mode):
+    port = free_port()
+    proc = start_server(port, 0.0)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return udpclient.main("127.0.0.1", port, mode, "adaptive", "fixed", count, packet_size,
+                                  window=window_packets * packet_size)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def fill_ring(window_packets, packet_size, ack_step, data, now):#环形发送窗口
+    window = sendwindow.SendWindow(udpclient.HEADER, 1, packet_size, window_packets)
+    seq = 1
+    for _ in range(window_packets):
+        window.put(seq, data, now)
+        seq += packet_size
+    for ack in range(1 + ack_step * packet_size, seq + ack_step * packet_size, ack_step * packet_size):
+        for _ in window.ack_until(ack):
+            pass
+
+def fill_dict(window_packets, packet_size, ack_step, data, now):#原来的表示: 每个包一个字典, 累计确认时扫描全部未确认的包
+    packets_unacked = {}
+    seq = 1
+    for i in range(window_packets):
+        packets_unacked[seq] = {
+            'packet': udpclient.pack_header(seq, 0, 0, len(data)) + data,
+            'send_time': now,
+            'packet_idx': i + 1,
+            'data_len': len(data),
+            'retransmitted': False,
+        }
+        seq += packet_size
+    for ack in range(1 + ack_step * packet_size, seq + ack_step * packet_size, ack_step * packet_size):
+        for key in list(packets_unacked.keys()):
+            if key < ack:
+                packets_unacked.pop(key)
+
+def window_cost(fill, window_packets, packet_size, ack_step):#返回 (每包微秒数, tracemalloc统计的内存峰值字节)
+    data = b'.' * packet_size
+    start = time.perf_counter()
+    fill(window_packets, packet_size, ack_step, data, time.time())
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()  # 内存单独再跑一次, 不让tracemalloc的开销算进耗时
+    fill(window_packets, packet_size, ack_step, data, time.time())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / window_packets * 1e6, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Sender cost with large windows")
+    parser.add_argument("--windows", default="1000,10000,50000", help="窗口大小列表(包数)")
+    parser.add_argument("--packet-size", type=int, default=udpclient.PACKET_SIZE)
+    parser.add_argument("--count", type=int, default=100000, help="每次发送的数据包数")
+    parser.add_argument("--mode", choices=["gbn", "sr"], default="sr")
+    parser.add_argument("--ack-step", type=int, default=64, help="单独测存储时每次累计确认的包数")
+    parser.add_argument("--runs", type=int, default=3, help="每种配置重复次数, 取最好的一次")
+    args = parser.parse_args()
+
+    print(f"{'window':>8}{'pkts/s':>12}{'sends':>9}{'time(s)':>9}"
+          f"{'ring us/pkt':>13}{'ring KB':>9}{'dict us/pkt':>13}{'dict KB':>9}")
+    for window_packets in (int(x) for x in args.windows.split(",")):
+        results = [run_once(window_packets, args.packet_size, args.count, args.mode) for _ in range(args.runs)]
+        best = min((r for r in results if r), key=lambda r: r['elapsed'])
+        ring_us, ring_peak = window_cost(fill_ring, window_packets, args.packet_size, args.ack_step)
+        dict_us, dict_peak = window_cost(fill_dict, window_packets, args.packet_size, args.ack_step)
+        print(f"{window_packets:>8}{args.count / best['elapsed']:>12.0f}{best['total_send_num']:>9}"
+              f"{best['elapsed']:>9.2f}{ring_us:>13.2f}{ring_peak / 1024:>9.0f}{dict_us:>13.2f}{dict_peak / 1024:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import time
+
+# ======================== 拥塞控制 ========================
+# 发送端根据ACK和超时事件调整拥塞窗口cwnd(字节), 发送窗口取min(cwnd, 上限).
+# 所有算法实现同样的接口:
+#   window()                      当前允许在途的字节数
+#   on_ack(acked_bytes, srtt)     新数据被确认, srtt为当前平滑RTT(秒, 可能为None)
+#   on_timeout(flight_bytes)      重传超时
+#   on_loss(flight_bytes)         通过重复ACK等方式提前发现丢包(不等超时)
+
+class FixedWindow:
+    # 原来的固定窗口, 不随网络状况变化
+    name = 'fixed'
+
+    def __init__(self, mss, window):
+        self.mss = mss
+        self.cwnd = window
+        self.ssthresh = window
+
+    def window(self):
+        return self.cwnd
+
+    def on_ack(self, acked_bytes, srtt):
+        pass
+
+    def on_timeout(self, flight_bytes):
+        pass
+
+    def on_loss(self, flight_bytes):
+        pass
+
+class Reno:
+    # 慢启动 + 拥塞避免(AIMD):
+    #   cwnd < ssthresh: 每确认N字节cwnd增加N字节, 每个RTT翻倍
+    #   cwnd >= ssthresh: 每个RTT增加1个MSS
+    #   超时: ssthresh = 在途数据/2, cwnd回到1个MSS重新慢启动
+    #   提前发现丢包: ssthresh = cwnd/2, cwnd = ssthresh(乘性减)
+    name = 'reno'
+
+    def __init__(self, mss, max_window, initial_window=2):
+        self.mss = mss
+        self.max_window = max_window
+        self.cwnd = initial_window * mss
+        self.ssthresh = max_window
+
+    def window(self):
+        return min(int(self.cwnd), self.max_window)
+
+    def on_ack(self, acked_bytes, srtt):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked_bytes
+        else:
+            self.cwnd += self.mss * acked_bytes / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_timeout(self, flight_bytes):
+        self.ssthresh = max(flight_bytes / 2, 2 * self.mss)
+        self.cwnd = self.mss
+
+    def on_loss(self, flight_bytes):
+        self.ssthresh = max(self.cwnd / 2, 2 * self.mss)
+        self.cwnd = self.ssthresh
+
+class Cubic(Reno):
+    # CUBIC (RFC 8312): 拥塞避免阶段窗口按距上次丢包的时间t增长
+    #   W(t) = C * (t - K)^3 + W_max,  K = cbrt(W_max * (1 - beta) / C)
+    # 单位为MSS; 同时计算同等条件下Reno的窗口, 取两者较大值(TCP友好区)
+    name = 'cubic'
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, mss, max_window, initial_window=2):
+        super().__init__(mss, max_window, initial_window)
+        self.w_max = 0.0        # 上次丢包时的窗口(MSS)
+        self.epoch_start = None # 本轮拥塞避免开始的时间
+        self.k = 0.0
+
+    def on_ack(self, acked_bytes, srtt):
+        if self.cwnd < self.ssthresh:
+            self.cwnd = min(self.cwnd + acked_bytes, self.max_window)
+            return
+
+        now = time.monotonic()
+        cwnd_mss = self.cwnd / self.mss
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if cwnd_mss < self.w_max:
+                self.k = ((self.w_max - cwnd_mss) / self.C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = cwnd_mss
+
+        rtt = srtt or 0.0
+        t = now - self.epoch_start + rtt
+        target = self.C * (t - self.k) ** 3 + self.w_max
+        w_est = self.w_max * self.BETA + 3 * (1 - self.BETA) / (1 + self.BETA) * (t / rtt if rtt else 0)
+        target = max(target, w_est)
+
+        # 每确认一个MSS, 窗口向目标靠近 (target - cwnd) / cwnd 个MSS
+        if target > cwnd_mss:
+            cwnd_mss += (target - cwnd_mss) / cwnd_mss * (acked_bytes / self.mss)
+        else:
+            cwnd_mss += 0.01 * acked_bytes / self.mss / cwnd_mss
+        self.cwnd = min(cwnd_mss * self.mss, self.max_window)
+
+    def _reduce(self):
+        self.w_max = self.cwnd / self.mss
+        self.epoch_start = None
+        self.ssthresh = max(self.cwnd * self.BETA, 2 * self.mss)
+
+    def on_timeout(self, flight_bytes):
+        self._reduce()
+        self.cwnd = self.mss
+
+    def on_loss(self, flight_bytes):
+        self._reduce()
+        self.cwnd = self.ssthresh
+
+ALGORITHMS = {
+    'fixed': FixedWindow,
+    'reno': Reno,
+    'cubic': Cubic,
+}
+
+def create(name, mss, window):#按名称创建拥塞控制算法, window对fixed是固定窗口, 对其余算法是窗口上限
+    return ALGORITHMS[name](mss, window)
@@ -0,0 +1,110 @@
+import math
+import bisect
+
+# ======================== 流式统计 ========================
+# 不保存样本, 每个样本O(1)更新, 内存固定:
+#   - 均值/方差: Welford算法, 数值稳定
+#   - 最大/最小值
+#   - 分位数: P²算法(Jain & Chlamtac 1985), 每个分位数只维护5个标记点
+# std为样本标准差(除以n-1), 与原来pandas.Series.std()一致
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class P2Quantile:
+    def __init__(self, p):
+        self.p = p
+        self.heights = []                   # 5个标记点的高度(估计的分位数值), 前5个样本时为排好序的样本
+        self.positions = [1, 2, 3, 4, 5]    # 标记点的实际位置
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]  # 标记点的理想位置
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]        # 每个样本理想位置的增量
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+
+        n = self.positions
+        # 找到x所在的区间, 必要时更新两端的极值
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # 中间3个标记点偏离理想位置超过1时移动一格, 高度用抛物线插值, 越界时改用线性插值
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = self._parabolic(i, d)
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return math.nan
+        if len(q) == 5 and self.positions[4] > 5:
+            return q[2]
+        # 样本不足时直接在排好序的样本上线性插值
+        pos = self.p * (len(q) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(q) - 1)
+        return q[lo] + (q[hi] - q[lo]) * (pos - lo)
+
+class RunningStats:
+    def __init__(self, quantiles=QUANTILES):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0                       # 与均值之差的平方和
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        for estimator in self.quantiles.values():
+            estimator.add(x)
+
+    def std(self):
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def quantile(self, p):
+        return self.quantiles[p].value()
+
+    def summary(self):#汇总为字典, 键为 count/min/max/mean/std/p50/p95/p99
+        result = {
+            'count': self.count,
+            'min': self.min if self.count else math.nan,
+            'max': self.max if self.count else math.nan,
+            'mean': self.mean if self.count else math.nan,
+            'std': self.std(),
+        }
+        for p, estimator in self.quantiles.items():
+            result[f"p{p * 100:g}"] = estimator.value()
+        return result
@@ -0,0 +1,116 @@
+from array import array
+
+# ======================== 环形发送窗口 ========================
+# 已发送未确认的包按发送顺序放在环形缓冲区里, 第k个包(从0开始)的序列号为 first_seq + k * packet_size
+# (只有最后一个包可能较短), 所以由序列号直接算出槽位, 不需要字典:
+#   - 每个槽位一个发送时间(array 'd')、数据长度(array 'H')和状态(bytearray)
+#   - 所有包的首部+数据放在同一个预分配的bytearray里, 首部用预编译的struct.Struct.pack_into直接写入
+#   - 累计确认从窗口起点依次释放槽位, 每个包只被释放一次, 均摊O(1); 选择确认按序列号O(1)定位
+# 在途的包数超过容量时容量翻倍(按序复制一次), 发送函数拿到的是槽位的memoryview, 不复制数据
+
+EMPTY = 0          # 槽位空闲, 或包已被确认
+IN_FLIGHT = 1      # 已发送未确认
+RETRANSMITTED = 2  # 已发送未确认, 且重传过(Karn算法: 不产生RTT样本)
+
+class SendWindow:
+    def __init__(self, header, first_seq, packet_size, capacity=64):
+        self.header = header              # 协议首部的struct.Struct
+        self.first_seq = first_seq        # 第一个数据包的序列号
+        self.packet_size = packet_size
+        self.slot_size = header.size + packet_size
+        self.base = 0                     # 窗口起点(最早的未释放的包)的编号
+        self.next = 0                     # 下一个要放入的包的编号
+        self.unacked = 0                  # 窗口内还没确认的包数
+        self._allocate(max(1, capacity))
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.send_times = array('d', bytes(8 * capacity))
+        self.lengths = array('H', bytes(2 * capacity))
+        self.states = bytearray(capacity)
+        self.buffer = bytearray(self.slot_size * capacity)
+        self.view = memoryview(self.buffer)
+
+    def _grow(self):#容量翻倍, 把 [base, next) 的槽位按新容量重新放置
+        old = (self.capacity, self.send_times, self.lengths, self.states, self.view)
+        self._allocate(self.capacity * 2)
+        capacity, send_times, lengths, states, view = old
+        for k in range(self.base, self.next):
+            i, j = k % capacity, k % self.capacity
+            self.send_times[j] = send_times[i]
+            self.lengths[j] = lengths[i]
+            self.states[j] = states[i]
+            self.view[j * self.slot_size:(j + 1) * self.slot_size] = view[i * self.slot_size:(i + 1) * self.slot_size]
+
+    def _index(self, seq):#序列号对应的包编号, 不在窗口内(或不是包的起点)时返回None
+        k, rem = divmod(seq - self.first_seq, self.packet_size)
+        if rem or not self.base <= k < self.next:
+            return None
+        return k
+
+    def seq(self, k):
+        return self.first_seq + k * self.packet_size
+
+    def _packet(self, slot):
+        start = slot * self.slot_size
+        return self.view[start:start + self.header.size + self.lengths[slot]]
+
+    def put(self, seq, data, now):#放入一个新包并返回它的memoryview(首部+数据); seq必须是下一个包的序列号
+        if self.next - self.base == self.capacity:
+            self._grow()
+        slot = self.next % self.capacity
+        start = slot * self.slot_size
+        self.header.pack_into(self.buffer, start, seq, 0, 0, len(data), b'\x00')
+        self.buffer[start + self.header.size:start + self.header.size + len(data)] = data
+        self.lengths[slot] = len(data)
+        self.send_times[slot] = now
+        self.states[slot] = IN_FLIGHT
+        self.next += 1
+        self.unacked += 1
+        return self._packet(slot)
+
+    def is_unacked(self, seq):
+        k = self._index(seq)
+        return k is not None and self.states[k % self.capacity] != EMPTY
+
+    def send_time(self, seq):#未确认的包的最近一次发送时间, 其他情况返回None
+        k = self._index(seq)
+        if k is None or self.states[k % self.capacity] == EMPTY:
+            return None
+        return self.send_times[k % self.capacity]
+
+    def packet_idx(self, seq):#包的序号, 从1开始
+        return (seq - self.first_seq) // self.packet_size + 1
+
+    def retransmit(self, seq, now):#标记为重传并更新发送时间, 返回要重发的memoryview
+        slot = self._index(seq) % self.capacity
+        self.send_times[slot] = now
+        self.states[slot] = RETRANSMITTED
+        return self._packet(slot)
+
+    def unacked_seqs(self):#窗口内所有未确认的包的序列号, 按发送顺序
+        return [self.seq(k) for k in range(self.base, self.next) if self.states[k % self.capacity] != EMPTY]
+
+    def ack_one(self, seq):#选择确认一个包, 返回 (数据长度, 发送时间, 是否重传过); 已确认或不在窗口内时返回None
+        k = self._index(seq)
+        if k is None:
+            return None
+        slot = k % self.capacity
+        state = self.states[slot]
+        if state == EMPTY:
+            return None
+        self.states[slot] = EMPTY
+        self.unacked -= 1
+        return self.lengths[slot], self.send_times[slot], state == RETRANSMITTED
+
+    def ack_until(self, ack):#累计确认: 释放序列号小于ack的所有槽位, 逐个返回还没确认过的包 (seq, 数据长度, 发送时间, 是否重传过)
+        states = self.states
+        capacity = self.capacity
+        while self.base < self.next and self.seq(self.base) < ack:
+            slot = self.base % capacity
+            state = states[slot]
+            self.base += 1
+            if state != EMPTY:
+                states[slot] = EMPTY
+                self.unacked -= 1
+                yield self.seq(self.base - 1), self.lengths[slot], self.send_times[slot], state == RETRANSMITTED
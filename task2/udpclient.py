@@ -1,10 +1,21 @@
 import socket
 import struct
+import os
+import hashlib
 import random
 import time
 import sys
 import threading
-import pandas as pd
+import argparse
+import heapq
+import select
+import json
+import math
+import logging
+
+import congestion
+import metrics
+import sendwindow
 
 # ======================== 协议首部定义 ========================
 # 首部格式说明:
@@ -15,225 +26,641 @@ import pandas as pd
 #   - 'H' 表示2字节无符号短整数 (数据长度)
 #   - '1s' 表示1字节填充字段
 HEADER_FORMAT = '!IIBH1s'
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER = struct.Struct(HEADER_FORMAT)  # 预编译的首部格式, 打包/解包时不再解析格式字符串
+HEADER_SIZE = HEADER.size
 
 # ======================== 协议标志位定义 ========================
 SYN = 1
 ACK = 2
 FIN = 4
+SACK = 8  # 选择确认: SYN中表示使用选择重传; ACK中表示首部的序列号字段是被单独确认的包
+
+# ======================== 文件传输 ========================
+# SYN的数据部分: 8字节文件大小 + UTF-8文件名(合成数据时没有数据部分)
+# FIN的数据部分: 发送数据的SHA-256; FIN-ACK的数据部分: 服务器收到数据的SHA-256
+FILE_META = struct.Struct('!Q')
+MAX_FILE_SIZE = 2**32 - 2**16  # 序列号只有4字节, 按字节计数, 文件不能超过约4GB
 
 # ======================== 客户端配置参数 ========================
 TOTAL_PACKETS_TO_SEND = 30  #一共要发送的数量
-WINDOW_SIZE = 400  
-PACKET_SIZE = 80
-TIMEOUT = 0.5  # 超时时间0.5秒
+WINDOW_SIZE = 400  # 固定窗口(--cc fixed)的大小
+MAX_WINDOW = 64 * 1024  # 拥塞窗口上限, 与服务器的接收缓存RECV_WINDOW一致
+CC_ALGORITHM = 'reno'  # 拥塞控制算法: 'fixed', 'reno', 'cubic'
+PACKET_SIZE = 80  # 默认每个包的数据长度(字节), 可用 --packet-size 修改
+MTU_PAYLOAD = 1500 - 20 - 8 - HEADER_SIZE  # 以太网MTU减去IP/UDP首部和本协议首部, 不会被IP分片
+MAX_PAYLOAD = 65507 - HEADER_SIZE  # 单个UDP数据报能携带的最大数据长度
+MAX_DATAGRAM = 65535  # recvfrom的缓冲区大小, 足够收下任何数据报
+RECV_BATCH = 64  # 每次唤醒最多连续收取的数据报数, 1表示每次只收一个
+SOCKET_BUFFER = 1 << 20  # socket收发缓冲区大小, 大窗口时避免内核缓冲区溢出丢包
+TIMEOUT = 0.5  # 超时时间0.5秒, 固定RTO模式下使用, 也是自适应RTO的初始值
+MODE = 'gbn'  # 'gbn': 回退N步; 'sr': 选择重传
+RTO_MODE = 'adaptive'  # 'adaptive': 按RTT样本估算超时时间; 'fixed': 始终使用TIMEOUT
+MIN_RTO = 0.05  # 自适应RTO的下限(秒)
+MAX_RTO = 8.0   # 自适应RTO(含退避)的上限(秒)
+RECV_POLL = 0.2 # 接收线程recvfrom的超时(秒)
+SYN_TIMEOUT = 2.0  # 等待 SYN-ACK 的时间(秒)
+SYN_RETRIES = 3    # SYN 最多发送的次数, SYN 或 SYN-ACK 丢失时重发
+FIN_TIMEOUT = 2.0  # 等待 FIN-ACK 的时间(秒)
+FIN_RETRIES = 3    # FIN 最多发送的次数
+DUP_ACK_THRESHOLD = 3  # 收到几个重复的累计确认就快速重传, 0表示关闭, 只靠超时重传
+STATS_INTERVAL = 0  # 每隔多少秒输出一行统计汇总, 0表示不输出
+
+# 计数器: 发送的数据包(含重传)/重传的包/超时次数/快速重传次数/收到的ACK数据报/发送的有效数据字节/被确认的字节
+CLIENT_COUNTERS = ('sent', 'retransmitted', 'timeouts', 'fast_retransmits', 'acks', 'bytes_sent', 'bytes_acked')
+# 直方图: RTT样本(ms)/每次唤醒收到的ACK数
+CLIENT_HISTOGRAMS = ('rtt_ms', 'ack_batch')
 
 # ======================== 全局状态变量 ========================
 send_start = 0              # 发送窗口起始位置（字节）
 next_seq_num = 0            # 下一个要发送的数据包起始位置
 lock = threading.Lock()     # 线程同步锁
+wakeup = threading.Condition(lock)  # 发送线程在此等待: 收到ACK或最早的包超时时被唤醒
+
+# 已发送但未确认的数据包: 环形发送窗口(sendwindow.py), 每个包的首部+数据、发送时间、数据长度
+# 和是否重传过(Karn算法: 重传过的包不产生RTT样本)都放在预分配的数组里, 由序列号直接定位槽位
+inflight = None
+
+# 重传定时器: 按发送时间排序的最小堆, 元素为 (send_time, seq_num).
+# 所有包共用同一个RTO, 所以发送时间最早的包最先超时. 包被确认或重传后旧元素不删除,
+# 取出时发现 send_time 对不上就丢弃(惰性删除)
+timer_heap = []
 
-# 已发送但未确认的数据包存储结构:
-#   key: 序列号 (seq_num)
-#   value: 字典包含:
-#     'packet': 完整数据包字节
-#     'send_time': 发送时间戳
-#     'packet_idx': 包序号
-packets_unacked = {}
+# 快速重传(RFC 5681)和快速恢复(NewReno, RFC 6582):
+#   接收端每发现一个空洞都立即重发当前的累计确认号, 发送端收到dup_ack_threshold个重复ACK就认为窗口起点的包丢了,
+#   不等超时立即重传(GBN重传整个窗口, SR只重传这一个包), 拥塞窗口按on_loss减半.
+#   恢复期间确认号前进但没越过recover时(部分确认), 说明新的窗口起点也丢了, 如果它在恢复开始前发出就立即重传
+#   每个重复ACK说明有一个包离开了网络, 发送窗口临时增加一个MSS: 达到阈值之前可以继续发新包(limited transmit,
+#   RFC 3042), 小窗口时也能凑够重复ACK; SR在恢复期间同样放大窗口, 让后续的空洞也能被重复ACK发现
+dup_ack_threshold = DUP_ACK_THRESHOLD
+dup_acks = 0                # 连续收到的重复ACK数
+in_recovery = False         # 是否处于快速恢复
+recover = 0                 # 进入快速恢复时已发送的最后一个字节, 确认号越过它时恢复结束
+recovery_start = 0.0        # 进入快速恢复的时间
+retransmit_requests = []    # 接收线程发现的丢包(序列号), 由发送线程重传
 
-RTT_OK = []                 # 存储成功的往返时间样本
-total_send_num = 0          # 总发送数据包计数（含重传）
+# 每个RTT记录一次拥塞窗口: 当发送窗口起点越过上一轮结束时发送的最后一个字节, 就算过了一个RTT
+cwnd_log = []               # (距开始的秒数, cwnd, ssthresh, 本轮goodput 字节/秒)
+round_end = 0               # 本轮结束的序列号
+round_start_time = 0.0      # 本轮开始的时间
+round_acked = 0             # 本轮确认的字节数
+transfer_start = 0.0        # 数据传输开始的时间
+
+stats = metrics.Metrics(CLIENT_COUNTERS, CLIENT_HISTOGRAMS)
+rtt_stats = stats.histograms['rtt_ms']  # RTT样本(ms)的流式统计, 不保存样本本身
+packets_to_send = TOTAL_PACKETS_TO_SEND  # 本次要发送的数据包数
 receiver_active = True      # 接收线程活动标志
 acked_packet_num = 0        # 已确认的数据包计数
 all_packets_acked = threading.Event()  # 所有包确认完成事件
+fin_acked = threading.Event()          # 收到 FIN-ACK 事件(由接收线程设置)
+fin_ack_num = 0                        # FIN-ACK 中的确认号
+fin_ack_digest = b''                   # FIN-ACK 中服务器计算的SHA-256
+
+log = logging.getLogger('udpclient')
 
 def pack_header(seq_num, ack_num, flags=0, data_len=0):#打包首部
-    return struct.pack(HEADER_FORMAT, seq_num, ack_num, flags, data_len, b'\x00')
+    return HEADER.pack(seq_num, ack_num, flags, data_len, b'\x00')
 
 def unpack_header(packet):#解包首部
     try:
-        return struct.unpack(HEADER_FORMAT, packet[:HEADER_SIZE])
+        return HEADER.unpack_from(packet)
     except struct.error:
         return None, None, None, None, None
 
-def handle_acks(client_socket):#单独在一个线程,用于接收服务器的ACK
-    global send_start, RTT_OK, receiver_active, acked_packet_num, next_seq_num
+class RTOEstimator:
+    # Jacobson/Karels算法估算重传超时 (RFC 6298):
+    #   SRTT   = 7/8 * SRTT + 1/8 * R
+    #   RTTVAR = 3/4 * RTTVAR + 1/4 * |SRTT - R|
+    #   RTO    = SRTT + 4 * RTTVAR
+    # 每次超时RTO加倍(指数退避), 收到新的有效样本或确认了新数据的ACK后恢复
+    def __init__(self, adaptive=True):
+        self.adaptive = adaptive
+        self.srtt = None
+        self.rttvar = None
+        self.rto = TIMEOUT
+        self.backoff = 1
+
+    def sample(self, rtt):#rtt单位为秒, 只能传入未重传过的包的样本(Karn算法)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+        self.backoff = 1
+
+    def on_progress(self):#ACK确认了新数据, 说明链路仍然通畅, 即使没有有效样本也取消退避
+        self.backoff = 1
+
+    def on_timeout(self):
+        if self.adaptive:
+            self.backoff = min(self.backoff * 2, 64)
+
+    def timeout(self):#当前使用的超时时间(秒)
+        if not self.adaptive:
+            return TIMEOUT
+        return min(MAX_RTO, self.rto * self.backoff)
+
+rto = RTOEstimator(adaptive=RTO_MODE == 'adaptive')
+cc = congestion.create(CC_ALGORITHM, PACKET_SIZE, MAX_WINDOW)
+
+def log_cwnd_round(now):#窗口越过本轮终点时输出一行cwnd日志, 调用时需持有锁
+    global round_end, round_start_time, round_acked
+    if send_start < round_end:
+        return
+    duration = now - round_start_time
+    goodput = round_acked / duration if duration > 0 else 0.0
+    cwnd_log.append((now - transfer_start, cc.window(), cc.ssthresh, goodput))
+    log.info("[cwnd] t=%.0f ms, cwnd=%d B, ssthresh=%.0f B, goodput=%.1f KB/s",
+             (now - transfer_start) * 1000, cc.window(), cc.ssthresh, goodput / 1024)
+    round_end = next_seq_num
+    round_start_time = now
+    round_acked = 0
+
+def send_window(mode):#拥塞窗口加上重复ACK带来的额度(字节), 确认号前进时dup_acks清零, 额度随之收回
+    window = cc.window()
+    if not dup_ack_threshold:
+        return window
+    if not in_recovery:
+        return window + min(dup_acks, dup_ack_threshold - 1) * cc.mss
+    if mode == 'sr':
+        return window + dup_acks * cc.mss
+    return window  # GBN的接收端丢弃乱序包, 空洞填上之前多发的新包都会被丢弃
+
+def schedule_timer(seq, send_time):#为刚发送(或重传)的包登记定时器
+    heapq.heappush(timer_heap, (send_time, seq))
+
+def synthetic_payloads(count, packet_size):#原来的测试数据: 内容为序号, 用'.'填充到packet_size(过长时截断)
+    for i in range(count):
+        yield f"No.{i+1} Packet".ljust(packet_size, '.')[:packet_size].encode('utf-8')
+
+def file_payloads(f, packet_size):#按需从文件读取数据, 不预先生成所有包
+    while True:
+        data = f.read(packet_size)
+        if not data:
+            return
+        yield data
+
+def recv_batch(sock, limit):#等待socket可读, 然后一次取走已到达的数据报(最多limit个); 超时返回空列表
+    if not select.select([sock], [], [], RECV_POLL)[0]:
+        return []
+    batch = []
+    while len(batch) < limit:
+        try:
+            batch.append(sock.recvfrom(MAX_DATAGRAM)[0])
+        except BlockingIOError:
+            break
+    return batch
+
+def send_batch(sock, packets, addr):#连续发出一批数据报; socket是非阻塞的, 发送缓冲区满时等到可写再继续
+    for packet in packets:
+        while True:
+            try:
+                sock.sendto(packet, addr)
+                break
+            except BlockingIOError:
+                select.select([], [sock], [], RECV_POLL)
+
+def oldest_timer():#返回仍然有效的最早的 (send_time, seq), 顺便丢弃失效的元素; 没有时返回None
+    while timer_heap:
+        send_time, seq = timer_heap[0]
+        if inflight.send_time(seq) == send_time:
+            return send_time, seq
+        heapq.heappop(timer_heap)
+    return None
+
+def handle_acks(client_socket, batch_size):#单独在一个线程,用于接收服务器的ACK
+    global send_start, receiver_active, acked_packet_num, next_seq_num, fin_ack_num, fin_ack_digest, round_acked
+    global dup_acks, in_recovery, recover, recovery_start
     
     while receiver_active:
         try:
-            response, _ = client_socket.recvfrom(1024)
-            _, res_ack, res_flags, _, _ = unpack_header(response) #解包
-            
-            if res_flags and res_flags & ACK:
-                with lock:#线程安全锁
-                    # GBN协议：任何ACK都表示之前所有包都已收到
-                    if res_ack > send_start:   
-                        # 移除所有已确认的包
-                        for seq in list(packets_unacked.keys()):
-                            if send_start <= seq < res_ack:
-                                value = packets_unacked.pop(seq)
-                                RTT = (time.time() - value['send_time']) * 1000
-                                RTT_OK.append(RTT)
-                                acked_packet_num += 1
-                                print(f"第{value['packet_idx']}个 (Seq={seq}) server端已经收到, RTT是{RTT:.2f} ms")
-                                
-                        send_start = res_ack
-                        #next_seq_num = send_start
-                    if acked_packet_num >= TOTAL_PACKETS_TO_SEND:
-                        all_packets_acked.set()
-
-        except socket.timeout:
-            continue #超时循环等待
+            batch = recv_batch(client_socket, batch_size)
         except Exception as e:
             if receiver_active:
-                print(f"接收线程出错: {e}")
+                log.error("接收线程出错: %s", e)
             break
-    print("接收线程已停止")
+        if not batch:
+            continue #超时循环等待
+
+        # 一批ACK只加一次锁、唤醒一次发送线程
+        with lock:#线程安全锁
+            now = time.time()
+            stats.observe('ack_batch', len(batch))
+            for response in batch:
+                res_seq, res_ack, res_flags, res_len, _ = unpack_header(response) #解包
+
+                if res_flags and res_flags & FIN:
+                    # FIN-ACK 也由接收线程收取, 避免和主线程抢同一个socket
+                    fin_ack_num = res_ack
+                    fin_ack_digest = response[HEADER_SIZE:HEADER_SIZE + res_len]
+                    fin_acked.set()
+                    continue
+
+                if not (res_flags and res_flags & ACK) or res_flags & SYN:
+                    continue  # 重发SYN后迟到的 SYN-ACK 也在这里忽略
+                stats.count('acks')
+                newest = None  # 本次ACK确认的最新发送的包 (发送时间, 是否重传过), 用它更新RTO
+                acked_bytes = 0
+
+                # SR协议: 首部的序列号字段是服务器单独确认的包(可能在窗口中间)
+                acked = inflight.ack_one(res_seq) if res_flags & SACK else None
+                if acked is not None:
+                    data_len, send_time, retransmitted = acked
+                    acked_packet_num += 1
+                    acked_bytes += data_len
+                    newest = (send_time, retransmitted)
+                    if retransmitted:
+                        log.debug("第%d个 (Seq=%d) server端已经收到(选择确认, 重传包不计RTT)", inflight.packet_idx(res_seq), res_seq)
+                    else:
+                        RTT = (now - send_time) * 1000
+                        rtt_stats.add(RTT)
+                        log.debug("第%d个 (Seq=%d) server端已经收到(选择确认), RTT是%.2f ms", inflight.packet_idx(res_seq), res_seq, RTT)
+
+                # 累计确认：任何ACK都表示之前所有包都已收到
+                advanced = res_ack > send_start
+                if advanced:   
+                    # 从窗口起点依次释放已确认的包, 只访问被释放的槽位
+                    for seq, data_len, send_time, retransmitted in inflight.ack_until(res_ack):
+                        acked_packet_num += 1
+                        acked_bytes += data_len
+                        if newest is None or send_time > newest[0]:
+                            newest = (send_time, retransmitted)
+                        if retransmitted:
+                            log.debug("第%d个 (Seq=%d) server端已经收到(重传包不计RTT)", inflight.packet_idx(seq), seq)
+                        else:
+                            RTT = (now - send_time) * 1000
+                            rtt_stats.add(RTT)
+                            log.debug("第%d个 (Seq=%d) server端已经收到, RTT是%.2f ms", inflight.packet_idx(seq), seq, RTT)
+                            
+                    send_start = res_ack
+
+                if advanced:
+                    dup_acks = 0
+                    if in_recovery and send_start >= recover:
+                        in_recovery = False
+                    elif in_recovery:
+                        # 部分确认: 新的窗口起点也丢了; 恢复开始后才发出(或已重传)的包不再重传
+                        send_time = inflight.send_time(send_start)
+                        if send_time is not None and send_time < recovery_start:
+                            retransmit_requests.append(send_start)
+                elif res_ack == send_start and inflight.is_unacked(send_start) and dup_ack_threshold:
+                    # 重复ACK: 服务器收到了窗口起点之后的包, 窗口起点还没到
+                    dup_acks += 1
+                    if dup_acks == dup_ack_threshold and not in_recovery:
+                        in_recovery = True
+                        recover = next_seq_num
+                        recovery_start = now
+                        cc.on_loss(next_seq_num - send_start)
+                        stats.count('fast_retransmits')
+                        retransmit_requests.append(send_start)
 
-def main(server_ip, server_port):
-    global send_start, next_seq_num, packets_unacked, total_send_num, receiver_active
+                # Karn算法: 重传过的包无法区分ACK对应哪一次发送, 不用来估算RTT
+                if newest is not None:
+                    rto.on_progress()
+                    if not newest[1]:
+                        rto.sample(now - newest[0])
+
+                    # 拥塞控制按新确认的字节数增大窗口
+                    round_acked += acked_bytes
+                    stats.count('bytes_acked', acked_bytes)
+                    cc.on_ack(acked_bytes, rto.srtt)
+                    log_cwnd_round(now)
+                    #next_seq_num = send_start
+
+            if acked_packet_num >= packets_to_send:
+                all_packets_acked.set()
+            wakeup.notify()  # 窗口可能已经滑动, 唤醒发送线程
+    log.info("接收线程已停止")
+
+def main(server_ip, server_port, mode=MODE, rto_mode=RTO_MODE, cc_algorithm=CC_ALGORITHM,
+         count=TOTAL_PACKETS_TO_SEND, packet_size=PACKET_SIZE, batch=RECV_BATCH, filename=None, window=None,
+         stats_interval=STATS_INTERVAL, dup_threshold=DUP_ACK_THRESHOLD):
+    global packets_to_send, send_start, next_seq_num, inflight, receiver_active, stats, rtt_stats, acked_packet_num, rto, cc
+    global dup_ack_threshold, dup_acks, in_recovery
+    global cwnd_log, round_end, round_start_time, round_acked, transfer_start
+
+    # 文件传输模式下包数由文件大小决定
+    if filename is not None:
+        file_size = os.path.getsize(filename)
+        if file_size > MAX_FILE_SIZE:
+            log.error("错误: 文件大小 %d 字节超过上限 %d 字节", file_size, MAX_FILE_SIZE)
+            return None
+        count = (file_size + packet_size - 1) // packet_size
+
+    # 重置全局状态, 便于在同一进程中多次运行(如bench_arq.py)
+    packets_to_send = count
+    send_start = 0
+    next_seq_num = 0
+    stats = metrics.Metrics(CLIENT_COUNTERS, CLIENT_HISTOGRAMS)
+    rtt_stats = stats.histograms['rtt_ms']
+    receiver_active = True
+    acked_packet_num = 0
+    all_packets_acked.clear()
+    fin_acked.clear()
+    timer_heap.clear()
+    retransmit_requests.clear()
+    dup_ack_threshold = dup_threshold
+    dup_acks = 0
+    in_recovery = False
+    rto = RTOEstimator(adaptive=rto_mode == 'adaptive')
+    # window: 固定窗口的大小或拥塞窗口的上限(字节), 默认分别为WINDOW_SIZE和MAX_WINDOW; 至少要能容纳一个包
+    if window is None:
+        window = WINDOW_SIZE if cc_algorithm == 'fixed' else MAX_WINDOW
+    window_limit = max(window, packet_size)
+    cc = congestion.create(cc_algorithm, packet_size, window_limit)
+    cwnd_log = []
+    round_acked = 0
 
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
     server_addr = (server_ip, server_port)
 
     # ========== 第一步：TCP三次握手模拟 ==========
-    # 1. 向服务端发送SYN包(第一次握手) 
+    # 1. 向服务端发送SYN包(第一次握手), 选择重传模式在SYN中带上SACK标志
     client_seq = random.randint(0, 1500)
-    SYN_packet = pack_header(client_seq, 0, flags=SYN)
-    client_socket.sendto(SYN_packet, server_addr)
-    print(f"已成功向 {server_addr} 发送 SYN (Seq={client_seq})")
+    # 文件传输模式下SYN带上文件大小和文件名, 服务器据此创建输出文件
+    meta = b'' if filename is None else FILE_META.pack(file_size) + os.path.basename(filename).encode('utf-8')
+    SYN_packet = pack_header(client_seq, 0, flags=SYN | SACK if mode == 'sr' else SYN, data_len=len(meta)) + meta
 
-    # 2. 服务端发送 SYN-ACK(第二次握手)
-    try:
-        client_socket.settimeout(2.0)
-        SYN_ACK_response, _ = client_socket.recvfrom(1024)
-        res_seq, res_ack, res_flags, _, _ = unpack_header(SYN_ACK_response)
+    # 2. 服务端发送 SYN-ACK(第二次握手), 超时说明 SYN 或 SYN-ACK 丢了, 重发 SYN
+    client_socket.settimeout(SYN_TIMEOUT)
+    SYN_ACK_response = None
+    for attempt in range(SYN_RETRIES):
+        client_socket.sendto(SYN_packet, server_addr)
+        log.info("已成功向 %s 发送 SYN (Seq=%d)", server_addr, client_seq)
+        try:
+            SYN_ACK_response, _ = client_socket.recvfrom(MAX_DATAGRAM)
+            break
+        except socket.timeout:
+            log.warning("等待 SYN-ACK 超时 (%d/%d)", attempt + 1, SYN_RETRIES)
+    if SYN_ACK_response is None:
+        log.error("错误: 服务器连接超时")
+        return None
+
+    res_seq, res_ack, res_flags, _, _ = unpack_header(SYN_ACK_response)
+    # 验证 SYN-ACK 包的标志位和确认号
+    if res_flags == SYN | ACK and res_ack == client_seq + 1:
+        log.info("成功收到 SYN-ACK (Seq=%d, Ack=%d)", res_seq, res_ack)
         
-        # 验证 SYN-ACK 包的标志位和确认号
-        if res_flags == SYN | ACK and res_ack == client_seq + 1:
-            print(f"成功收到 SYN-ACK (Seq={res_seq}, Ack={res_ack})")
-            
-            # 向服务端发送 ACK(第三次握手)
-            send_start = client_seq + 1
-            next_seq_num = send_start
-            ACK_packet = pack_header(send_start, res_seq + 1, flags=ACK)
-            client_socket.sendto(ACK_packet, server_addr)
-            print(f"成功发送 ACK (Ack={res_seq + 1}), 与 {server_addr} 的连接建立!")
-            
-        else:
-            print("有错误, 收到的不是 SYN-ACK 包")
-            return
-    except socket.timeout:
-        print("错误: 服务器连接超时")
-        return
+        # 向服务端发送 ACK(第三次握手), 这个ACK丢了也没关系, 服务器收到数据包同样会建立连接
+        send_start = client_seq + 1
+        next_seq_num = send_start
+        inflight = sendwindow.SendWindow(HEADER, send_start, packet_size, window_limit // packet_size + 1)
+        ACK_packet = pack_header(send_start, res_seq + 1, flags=ACK)
+        client_socket.sendto(ACK_packet, server_addr)
+        log.info("成功发送 ACK (Ack=%d), 与 %s 的连接建立!", res_seq + 1, server_addr)
+        
+    else:
+        log.error("有错误, 收到的不是 SYN-ACK 包")
+        return None
 
     # ========== 第二步：数据传输阶段 ==========
-    # 生成测试数据包（每个包包含序号和随机填充）
-    data_load = []
-    for i in range(TOTAL_PACKETS_TO_SEND):
-        # 内容为序号
-        data_load.append(f"No.{i+1} Packet".ljust(PACKET_SIZE, '.').encode('utf-8'))
+    # 数据按需生成(测试数据)或从文件读取, 发送时计算SHA-256, 在FIN中交给服务器校验
+    if filename is None:
+        source = None
+        payloads = synthetic_payloads(packets_to_send, packet_size)
+    else:
+        source = open(filename, 'rb')
+        payloads = file_payloads(source, packet_size)
+    sha = hashlib.sha256()
+    if packets_to_send == 0:
+        all_packets_acked.set()  # 空文件, 直接关闭连接
 
-    # 开始接收 ACK
+    # 开始接收 ACK, 接收线程用select等待, 每隔RECV_POLL秒检查一次是否需要退出
+    # socket改为非阻塞, 接收线程一次把缓冲区里的ACK取完
+    client_socket.setblocking(False)
     receiver_thread = threading.Thread(
         target=handle_acks, 
-        args=(client_socket,),
+        args=(client_socket, batch),
         daemon=True
     )
     receiver_thread.start()
+    reporter = metrics.start_reporter(lambda: log.info("[stats] %s", stats.format()), stats_interval) if stats_interval > 0 else None
 
-    cur_packet_idx = 0  # 当前要发送的数据包索引
+    data = next(payloads, None)  # 下一个要发送的数据, 先读出来才知道它能否放进窗口
+    start_time = time.time()
+    transfer_start = round_start_time = start_time
+    round_end = next_seq_num
 
     try:
-        while not all_packets_acked.is_set():
-            with lock:  # 获取线程锁
-                # 发送窗口内的新数据包(没满且有未发送的)
-                while send_start<= next_seq_num and next_seq_num + PACKET_SIZE <= send_start + WINDOW_SIZE and cur_packet_idx < TOTAL_PACKETS_TO_SEND:
-                    data = data_load[cur_packet_idx]
-                    
-                    packet_header = pack_header(next_seq_num, 0, flags=0, data_len=PACKET_SIZE)
-                    packet = packet_header + data
-                    
-                    # 发送并记录包信息
-                    packet_info = {
-                        'packet': packet,
-                        'send_time': time.time(),
-                        'packet_idx': cur_packet_idx + 1,
-                    }
-                    client_socket.sendto(packet, server_addr)
-                    packets_unacked[next_seq_num] = packet_info
-                    total_send_num += 1
-
-                    print(f"第{packet_info['packet_idx']}个 (Seq={next_seq_num}) client端已经发送")
-
-                    next_seq_num += PACKET_SIZE
-                    cur_packet_idx += 1
-
-                # 检查超时包并重传
+        with wakeup:  # 获取线程锁, 等待时会自动释放
+            while not all_packets_acked.is_set():
+                outgoing = []  # 本轮要发送的数据报, 在锁外一次性发出
+                # 快速重传: 接收线程收到足够的重复ACK后登记的丢包
+                if retransmit_requests:
+                    current_time = time.time()
+                    if mode == 'sr':
+                        lost = [seq for seq in retransmit_requests if inflight.is_unacked(seq)]
+                    else:
+                        lost = inflight.unacked_seqs()
+                    retransmit_requests.clear()
+                    for seq in lost:
+                        outgoing.append(inflight.retransmit(seq, current_time))
+                        schedule_timer(seq, current_time)
+                        stats.count('sent')
+                        stats.count('retransmitted')
+                        log.debug("快速重传第%d个 (Seq=%d) 数据包", inflight.packet_idx(seq), seq)
+
+                # 发送窗口内的新数据包(没满且有未发送的), 窗口大小由拥塞控制决定
+                while data is not None and send_start <= next_seq_num and next_seq_num + len(data) <= send_start + send_window(mode):
+                    # 首部和数据直接写进发送窗口的槽位, 发送的是槽位的memoryview
+                    send_time = time.time()
+                    outgoing.append(inflight.put(next_seq_num, data, send_time))
+                    schedule_timer(next_seq_num, send_time)
+                    stats.count('sent')
+                    stats.count('bytes_sent', len(data))
+
+                    log.debug("第%d个 (Seq=%d) client端已经发送", inflight.packet_idx(next_seq_num), next_seq_num)
+
+                    next_seq_num += len(data)
+                    sha.update(data)
+                    data = next(payloads, None)
+
+                # 检查超时包并重传: 只看堆顶, O(log n)
                 current_time = time.time()
-                if packets_unacked and current_time - min([info['send_time'] for info in packets_unacked.values()]) > TIMEOUT:
-                   print(f"超时, 重传窗口内所有包 (Seq={send_start}~{next_seq_num - 1})")
-                   for seq, info in list(packets_unacked.items()):
-                       if seq >= send_start and seq + PACKET_SIZE <= send_start + WINDOW_SIZE:
-                           info['send_time'] = current_time
-                           client_socket.sendto(info['packet'], server_addr)
-                           total_send_num += 1
-                           print(f"重传第{info['packet_idx']}个 (Seq={seq}) 数据包")
-                    
+                timeout = rto.timeout()
+                oldest = oldest_timer()
+                if oldest is not None and current_time - oldest[0] > timeout:
+                    rto.on_timeout()
+                    stats.count('timeouts')
+                    dup_acks = 0
+                    in_recovery = False  # 超时后重新开始, 之前的快速恢复作废
+                    cc.on_timeout(next_seq_num - send_start)
+                    if mode == 'sr':
+                        # SR: 每个包单独计时, 只重传超时的包
+                        while oldest is not None and current_time - oldest[0] > timeout:
+                            seq = oldest[1]
+                            outgoing.append(inflight.retransmit(seq, current_time))
+                            schedule_timer(seq, current_time)
+                            stats.count('sent')
+                            stats.count('retransmitted')
+                            log.debug("超时(RTO=%.0f ms), 重传第%d个 (Seq=%d) 数据包", timeout * 1000, inflight.packet_idx(seq), seq)
+                            oldest = oldest_timer()
+                    else:
+                       log.debug("超时(RTO=%.0f ms), 重传窗口内所有包 (Seq=%d~%d)", timeout * 1000, send_start, next_seq_num - 1)
+                       for seq in inflight.unacked_seqs():
+                           outgoing.append(inflight.retransmit(seq, current_time))
+                           schedule_timer(seq, current_time)
+                           stats.count('sent')
+                           stats.count('retransmitted')
+                           log.debug("重传第%d个 (Seq=%d) 数据包", inflight.packet_idx(seq), seq)
+                    oldest = oldest_timer()
+
+                if outgoing:
+                    # 发送期间释放锁, 接收线程可以继续处理ACK; 发完后重新检查窗口
+                    wakeup.release()
+                    try:
+                        send_batch(client_socket, outgoing, server_addr)
+                    finally:
+                        wakeup.acquire()
+                    continue
+
+                if all_packets_acked.is_set():
+                    break
+                # 睡到最早的包超时为止, 期间收到ACK会被提前唤醒
+                if oldest is None:
+                    wakeup.wait()
+                else:
+                    wakeup.wait(max(0.0, oldest[0] + rto.timeout() - time.time()))
+
     finally:
+        elapsed = time.time() - start_time  # 数据传输阶段用时
+        if source is not None:
+            source.close()
         # ========== 第三步：连接关闭（四次挥手） ==========
-        # (第一次挥手)
-        FIN_packet = pack_header(next_seq_num, 0, flags=FIN)
-        client_socket.sendto(FIN_packet, server_addr)
-        print(f"已成功向 {server_addr} 发送 FIN (Seq={next_seq_num})")
+        # (第一次挥手) FIN带上已发送数据的SHA-256
+        digest = sha.digest()
+        FIN_packet = pack_header(next_seq_num, 0, flags=FIN, data_len=len(digest)) + digest
+        # 等待服务端发送 FIN-ACK(这里是将第二次和第三次合并了), FIN-ACK 由接收线程收取; 超时重发FIN
+        for attempt in range(FIN_RETRIES):
+            send_batch(client_socket, [FIN_packet], server_addr)
+            log.info("已成功向 %s 发送 FIN (Seq=%d)", server_addr, next_seq_num)
+            if fin_acked.wait(FIN_TIMEOUT):
+                break
 
-        # 等待服务端发送 FIN-ACK(这里是将第二次和第三次合并了)
-        try:
-            client_socket.settimeout(5.0)
-            FIN_ACK_res, _ = client_socket.recvfrom(1024)
-            _, res_ack, res_flags, _, _ = unpack_header(FIN_ACK_res)
-            if res_flags == FIN | ACK:
-                print(f"成功收到 FIN-ACK (Ack={res_ack}), 连接正常关闭")
-                 
-                # (第四次挥手) 客户端发送ACK确认
-                FIN_ACK_packet = pack_header(next_seq_num + 1, res_ack, flags=ACK)
-                client_socket.sendto(FIN_ACK_packet, server_addr)
-                print(f"已成功向 {server_addr} 发送 ACK (Ack={res_ack})")
-        
-                # 等待一段时间确保服务器收到ACK
-                time.sleep(0.1)
-                
-        except socket.timeout:
-            print("警告: 等待服务器 FIN-ACK 超时")
+        verified = None
+        if fin_acked.is_set():
+            res_ack = fin_ack_num
+            log.info("成功收到 FIN-ACK (Ack=%d), 连接正常关闭", res_ack)
+            verified = fin_ack_digest == digest
+            if verified:
+                log.info("SHA-256 校验通过: %s", digest.hex())
+            else:
+                log.warning("警告: SHA-256 校验失败, 发送 %s, 服务器收到 %s", digest.hex(), fin_ack_digest.hex())
+             
+            # (第四次挥手) 客户端发送ACK确认
+            FIN_ACK_packet = pack_header(next_seq_num + 1, res_ack, flags=ACK)
+            send_batch(client_socket, [FIN_ACK_packet], server_addr)
+            log.info("已成功向 %s 发送 ACK (Ack=%d)", server_addr, res_ack)
+    
+            # 等待一段时间确保服务器收到ACK
+            time.sleep(0.1)
+        else:
+            log.warning("警告: 等待服务器 FIN-ACK 超时")
 
         # 清理资源
         receiver_active = False 
         receiver_thread.join()
         client_socket.close()
+        if reporter is not None:
+            reporter.set()
 
        # ========== 第四步：打印统计信息 ==========
-        print("\n" + "="*20 + " 【汇总信息】 " + "="*20)
+        total_send_num = stats.counters['sent']
+        bytes_sent = stats.counters['bytes_sent']  # 已发送的数据字节数(不含重传)
+        log.info("\n" + "="*20 + " 【汇总信息】 " + "="*20)
         if total_send_num > 0:
             # 丢包率的定义按题目要求: 30 / 实际发送的udp packet number
-            loss_rate = (TOTAL_PACKETS_TO_SEND / total_send_num) * 100
-            print(f"丢包率: {loss_rate:.2f}%")
-
-        if RTT_OK:
-            RTT_series = pd.Series(RTT_OK)
-            print("\n--- RTT 统计 (单位: ms) ---")
-            print(f"最大RTT: {RTT_series.max():.2f} ms")
-            print(f"最小RTT: {RTT_series.min():.2f} ms")
-            print(f"平均RTT: {RTT_series.mean():.2f} ms")
-            print(f"RTT标准差: {RTT_series.std():.2f}")
+            loss_rate = (packets_to_send / total_send_num) * 100
+            log.info("丢包率: %.2f%%", loss_rate)
+
+        if rtt_stats.count:
+            log.info("\n--- RTT 统计 (单位: ms) ---")
+            log.info("最大RTT: %.2f ms", rtt_stats.max)
+            log.info("最小RTT: %.2f ms", rtt_stats.min)
+            log.info("平均RTT: %.2f ms", rtt_stats.mean)
+            log.info("RTT标准差: %.2f", rtt_stats.std())
+            log.info("RTT分位数: p50 %.2f ms, p95 %.2f ms, p99 %.2f ms (共 %d 个样本)",
+                     rtt_stats.quantile(0.5), rtt_stats.quantile(0.95), rtt_stats.quantile(0.99), rtt_stats.count)
         else:
-            print("没有收集到有效的RTT样本。")
+            log.info("没有收集到有效的RTT样本。")
+        if rto.srtt is not None:
+            log.info("SRTT: %.2f ms, RTTVAR: %.2f ms, 最终RTO: %.0f ms", rto.srtt * 1000, rto.rttvar * 1000, rto.timeout() * 1000)
+        log.info("模式: %s, 拥塞控制: %s, 总发送数: %d, 重传数: %d, 超时次数: %d, 快速重传次数: %d, 收到ACK数: %d, 数据传输用时: %.2f s",
+                 mode.upper(), cc.name, total_send_num, stats.counters['retransmitted'], stats.counters['timeouts'],
+                 stats.counters['fast_retransmits'], stats.counters['acks'], elapsed)
+        goodput = bytes_sent / elapsed if elapsed > 0 else 0.0
+        log.info("有效数据: %d 字节, goodput: %.2f MB/s", bytes_sent, goodput / 1e6)
+
+    return {
+        'mode': mode,
+        'total_send_num': total_send_num,
+        'acks_received': stats.counters['acks'],
+        'retransmitted': stats.counters['retransmitted'],
+        'timeouts': stats.counters['timeouts'],
+        'fast_retransmits': stats.counters['fast_retransmits'],
+        'elapsed': elapsed,
+        'bytes_sent': bytes_sent,
+        'goodput': goodput,
+        'verified': verified,
+        'rtt': rtt_stats.summary(),
+        'cwnd_log': cwnd_log,
+    }
+
+def export_summary(path, result):#把本次运行的汇总追加为CSV的一行, 只有导出时才导入pandas
+    import pandas as pd
+    row = {key: value for key, value in result.items() if key not in ('rtt', 'cwnd_log')}
+    row.update({f"rtt_{key}": value for key, value in result['rtt'].items()})
+    pd.DataFrame([row]).to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+def print_json(result):#把汇总输出为一行JSON(不含cwnd日志), 供基准测试脚本解析; NaN输出为null
+    summary = {key: value for key, value in result.items() if key != 'cwnd_log'}
+    summary['rtt'] = {key: None if isinstance(value, float) and math.isnan(value) else value
+                      for key, value in result['rtt'].items()}
+    print(json.dumps(summary))
+
+def parse_packet_size(value):#--packet-size 参数: 整数或'mtu'
+    size = MTU_PAYLOAD if value == 'mtu' else int(value)
+    if not 1 <= size <= MAX_PAYLOAD:
+        raise argparse.ArgumentTypeError(f"数据长度必须在1到{MAX_PAYLOAD}之间")
+    return size
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print(f"用法: python {sys.argv[0]} <server_ip> <server_port>")
-        print(f"示例: python {sys.argv[0]} 127.0.0.1 11111")
-        sys.exit(1)
-    
-    SERVER_IP = sys.argv[1]
-    SERVER_PORT = int(sys.argv[2])
-    main(SERVER_IP, SERVER_PORT)
\ No newline at end of file
+    parser = argparse.ArgumentParser(usage=f"python {sys.argv[0]} <server_ip> <server_port> [--mode gbn|sr] [--rto adaptive|fixed] [--cc reno|cubic|fixed] [--count N] [--packet-size N|mtu] [--batch N] [--file PATH] [--window BYTES] [--export CSV] [--json] [--dupack N] [--verbose] [--stats-interval S]",
+                                     epilog=f"示例: python {sys.argv[0]} 127.0.0.1 11111")
+    parser.add_argument("server_ip")
+    parser.add_argument("server_port", type=int)
+    parser.add_argument("--mode", choices=["gbn", "sr"], default=MODE,
+                        help="gbn: 回退N步(超时重传整个窗口); sr: 选择重传(只重传超时的包)")
+    parser.add_argument("--rto", choices=["adaptive", "fixed"], default=RTO_MODE,
+                        help=f"adaptive: 按RTT估算超时并指数退避; fixed: 固定{TIMEOUT}s超时")
+    parser.add_argument("--cc", choices=sorted(congestion.ALGORITHMS), default=CC_ALGORITHM,
+                        help=f"拥塞控制算法; fixed为原来的固定{WINDOW_SIZE}字节窗口")
+    parser.add_argument("--count", type=int, default=TOTAL_PACKETS_TO_SEND, help="要发送的数据包数")
+    parser.add_argument("--packet-size", type=parse_packet_size, default=PACKET_SIZE,
+                        help=f"每个包的数据长度(字节), mtu表示{MTU_PAYLOAD}字节, 最大{MAX_PAYLOAD}")
+    parser.add_argument("--batch", type=int, default=RECV_BATCH, help="接收线程每次最多连续收取的ACK数")
+    parser.add_argument("--file", help="要传输的文件; 指定后忽略--count, 服务器把数据写入其输出目录")
+    parser.add_argument("--window", type=int, default=None,
+                        help=f"固定窗口大小或拥塞窗口上限(字节), 默认fixed为{WINDOW_SIZE}, 其余为{MAX_WINDOW}")
+    parser.add_argument("--export", help="把本次运行的汇总(含RTT统计)追加到CSV文件, 需要pandas")
+    parser.add_argument("--json", action="store_true", help="最后一行输出JSON格式的汇总")
+    parser.add_argument("--dupack", type=int, default=DUP_ACK_THRESHOLD,
+                        help="收到N个重复ACK就快速重传, 0表示关闭(只靠超时重传)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出逐包的发送/确认/重传日志")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help="每隔多少秒输出一行计数器/直方图汇总, 0表示不输出")
+    args = parser.parse_args()
+
+    listener = metrics.setup_logging(args.verbose)
+    try:
+        result = main(args.server_ip, args.server_port, args.mode, args.rto, args.cc, args.count,
+                      args.packet_size, args.batch, args.file, args.window, args.stats_interval, args.dupack)
+    finally:
+        listener.stop()  # 把队列中剩余的日志写完, 保证JSON是最后一行
+    if result is not None and args.export:
+        export_summary(args.export, result)
+    if result is not None and args.json:
+        print_json(result)
\ No newline at end of file
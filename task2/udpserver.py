@@ -1,7 +1,15 @@
 import socket
 import struct
+import os
+import hashlib
 import random
 import time
+import select
+import heapq
+import argparse
+import logging
+
+import metrics
 
 # ======================== 协议首部定义 ========================
 # 首部格式说明:
@@ -18,12 +26,47 @@ HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 SYN = 1
 ACK = 2
 FIN = 4
+SACK = 8  # 选择确认: SYN中表示客户端使用选择重传; ACK中表示首部的序列号字段是被单独确认的包
+
+# ======================== 文件传输 ========================
+# SYN的数据部分: 8字节文件大小 + UTF-8文件名(合成数据时没有数据部分)
+# FIN的数据部分: 客户端发送数据的SHA-256; FIN-ACK的数据部分: 服务器收到数据的SHA-256
+FILE_META = struct.Struct('!Q')
 
 # ======================== 服务器配置参数 ========================
 HOST = '127.0.0.1'
 PORT = 11111
 PACKET_LOSS_RATE = 0.3  # 30%的丢包率
-PACKET_SIZE = 80
+RECV_WINDOW = 64 * 1024  # 选择重传模式下接收端最多缓存的乱序数据(字节)
+MAX_CONNECTIONS = 1024   # 同时存在的连接数上限
+IDLE_TIMEOUT = 30.0      # 连接空闲超过该时间(秒)即被清除
+LAST_ACK_TIMEOUT = 5.0   # 发送 FIN-ACK 后等待客户端最后一个ACK的时间(秒)
+SWEEP_INTERVAL = 0.5     # 检查超时连接的间隔(秒)
+MAX_DATAGRAM = 65535     # recvfrom的缓冲区大小, 数据长度由客户端决定(最大到MTU以上)
+RECV_BATCH = 64          # 每次唤醒最多连续收取的数据报数, 1表示每次只收一个
+SOCKET_BUFFER = 1 << 20  # socket收发缓冲区大小, 多个客户端大窗口发送时避免内核丢包
+OUTPUT_DIR = 'received'  # 文件传输模式下收到的文件保存的目录
+ACK_EVERY = 1            # 每收到N个按序包确认一次, 1表示每个包都立即确认
+ACK_DELAY = 0.02         # 按序包最多延迟多久确认(秒); 出现乱序/重复包时总是立即确认
+STATS_INTERVAL = 0       # 每隔多少秒输出一行统计汇总, 0表示不输出
+STATS_PORT = 0           # 本机HTTP统计端口, 0表示不开启
+
+# 计数器: 收到的数据报/模拟丢弃的包/按序包/缓存或丢弃的乱序包/重复包/超出接收窗口的包/
+#         首部不合法的包/发出的ACK/按序交付的字节/新建连接/因连接数上限被忽略的SYN
+SERVER_COUNTERS = ('received', 'dropped', 'in_order', 'out_of_order', 'duplicates', 'out_of_window',
+                   'malformed', 'acks_sent', 'bytes_delivered', 'connections', 'rejected')
+# 直方图: 每次唤醒收到的数据报数
+SERVER_HISTOGRAMS = ('batch',)
+stats = metrics.Metrics(SERVER_COUNTERS, SERVER_HISTOGRAMS)
+log = logging.getLogger('udpserver')
+
+# 延迟ACK定时器: 最小堆, 元素为 (到期时间, 客户端地址); 连接的 ack_deadline 对不上就丢弃(惰性删除)
+ack_timers = []
+
+# ======================== 连接状态 ========================
+SYN_RCVD = 'SYN_RCVD'        # 已回复 SYN-ACK, 等待第三次握手的ACK
+ESTABLISHED = 'ESTABLISHED'  # 连接已建立, 数据传输中
+LAST_ACK = 'LAST_ACK'        # 已回复 FIN-ACK, 等待客户端最后的ACK
 
 def pack_header(seq_num, ack_num, flags=0, data_len=0):#用于打包首部
     return struct.pack(HEADER_FORMAT, seq_num, ack_num, flags, data_len, b'\x00')
@@ -34,99 +77,387 @@ def unpack_header(packet):#用于解包首部
     except struct.error:
         return None, None, None, None, None
 
-def main():
+def send_ack(outbox, client_addr, seq_num, expected_seq_num, flags=ACK):
+    server_time = time.time()
+    ack_payload = struct.pack('!d', server_time) # 将时间戳打包为8字节double
+    ack_header = pack_header(seq_num, expected_seq_num, flags=flags, data_len=len(ack_payload))
+    outbox.append((ack_header + ack_payload, client_addr))
+
+def recv_batch(sock, limit, timeout):#等待socket可读, 然后一次取走已到达的数据报(最多limit个); 超时返回空列表
+    if not select.select([sock], [], [], timeout)[0]:
+        return []
+    batch = []
+    while len(batch) < limit:
+        try:
+            batch.append(sock.recvfrom(MAX_DATAGRAM))
+        except BlockingIOError:
+            break
+    return batch
+
+def send_batch(sock, outbox):#把本批处理产生的回复一次发出; 发送缓冲区满时等到可写再继续
+    for packet, addr in outbox:
+        while True:
+            try:
+                sock.sendto(packet, addr)
+                break
+            except BlockingIOError:
+                select.select([], [sock], [], SWEEP_INTERVAL)
+
+def new_connection(seq_num, flags, now, ack_every=ACK_EVERY, ack_delay=ACK_DELAY):
+    # 每个客户端地址一份连接状态
+    return {
+        'state': SYN_RCVD,
+        'server_seq': random.randint(0, 1500),
+        'client_isn': seq_num,                   # 客户端SYN中的初始序列号, 用来识别重复的SYN
+        'expected_seq_num': seq_num + 1,
+        'selective_repeat': bool(flags & SACK),  # 客户端是否使用选择重传
+        'recv_buffer': {},                       # 选择重传模式下缓存的乱序包: 序列号 -> 数据
+        'buffered': 0,                           # recv_buffer中数据的总字节数, 不超过RECV_WINDOW
+        'last_active': now,                      # 最后一次收到该客户端数据包的时间
+        'fin_ack': b'',                          # 发出的 FIN-ACK 包, 重发时使用
+        'ack_every': ack_every,                  # ACK策略: 每N个按序包确认一次
+        'ack_delay': ack_delay,                  # ACK策略: 按序包最多延迟多久确认(秒)
+        'pending_acks': 0,                       # 已收到但还没确认的按序包数
+        'ack_deadline': None,                    # 延迟ACK的到期时间
+        'sha': hashlib.sha256(),                 # 按序交付的数据的SHA-256
+        'received': 0,                           # 按序交付的字节数
+        'file': None,                            # 文件传输模式下的输出文件(先写到.part临时文件)
+        'file_size': None,
+        'path': None,
+        'part_path': None,
+    }
+
+def open_output(conn, meta, output_dir, client_addr):#按SYN中的文件大小和文件名创建输出文件
+    conn['file_size'], = FILE_META.unpack_from(meta)
+    name = os.path.basename(meta[FILE_META.size:].decode('utf-8', 'replace'))
+    if name in ('', '.', '..'):
+        name = 'unnamed'
+    if '\x00' in name:
+        raise ValueError("file name contains a NUL byte")
+    os.makedirs(output_dir, exist_ok=True)
+    conn['path'] = os.path.join(output_dir, name)
+    conn['part_path'] = f"{conn['path']}.{client_addr[1]}.part"
+    conn['file'] = open(conn['part_path'], 'wb')
+    log.info("%s 将传输文件 %s (%d 字节), 写入 %s", client_addr, name, conn['file_size'], conn['path'])
+
+def deliver(conn, data):#按序交付数据: 计入校验和, 文件传输模式下直接写入磁盘
+    conn['sha'].update(data)
+    conn['received'] += len(data)
+    stats.count('bytes_delivered', len(data))
+    if conn['file'] is not None:
+        conn['file'].write(data)
+
+def unused_path(path):#文件名已存在时(如另一个客户端刚传完同名文件)加上编号, 不覆盖已有文件
+    root, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(path):
+        path = f"{root} ({n}){ext}"
+        n += 1
+    return path
+
+def finish_transfer(conn, client_addr, client_digest):#收到FIN: 校验SHA-256, 通过则把临时文件改为正式文件名
+    digest = conn['sha'].digest()
+    ok = digest == client_digest and conn['file_size'] in (None, conn['received'])
+    log.info("来自 %s 的数据共 %d 字节, SHA-256 %s: %s", client_addr, conn['received'], '校验通过' if ok else '校验失败', digest.hex())
+    if conn['file'] is not None:
+        conn['file'].close()
+        conn['file'] = None
+        if ok:
+            conn['path'] = unused_path(conn['path'])
+            os.replace(conn['part_path'], conn['path'])
+            log.info("文件已保存到 %s", conn['path'])
+        else:
+            os.remove(conn['part_path'])
+    return digest
+
+def close_connection(conn):#连接被清除或被同一地址的新连接替换, 删除没传完的临时文件
+    if conn['file'] is not None:
+        conn['file'].close()
+        conn['file'] = None
+        os.remove(conn['part_path'])
+
+def ack_now(outbox, conn, client_addr, seq_num=0, flags=ACK):#立即发送累计确认, 同时取消延迟ACK
+    send_ack(outbox, client_addr, seq_num, conn['expected_seq_num'], flags=flags)
+    conn['pending_acks'] = 0
+    conn['ack_deadline'] = None
+    stats.count('acks_sent')
+    if flags & SACK:
+        log.debug("成功向 %s 发送选择确认 (Seq=%d, Ack=%d)", client_addr, seq_num, conn['expected_seq_num'])
+    else:
+        log.debug("成功向 %s 发送累计确认 (Ack=%d)", client_addr, conn['expected_seq_num'])
+
+def ack_in_order(outbox, conn, client_addr, now):#按序包: 攒够ack_every个立即确认, 否则等延迟ACK定时器
+    conn['pending_acks'] += 1
+    if conn['pending_acks'] >= conn['ack_every']:
+        ack_now(outbox, conn, client_addr)
+    elif conn['ack_deadline'] is None:
+        conn['ack_deadline'] = now + conn['ack_delay']
+        heapq.heappush(ack_timers, (conn['ack_deadline'], client_addr))
+
+def next_ack_deadline(connections):#最早的延迟ACK到期时间, 顺便丢弃失效的定时器; 没有时返回None
+    while ack_timers:
+        deadline, addr = ack_timers[0]
+        conn = connections.get(addr)
+        if conn is not None and conn['ack_deadline'] == deadline:
+            return deadline
+        heapq.heappop(ack_timers)
+    return None
+
+def flush_delayed_acks(outbox, connections, now):#发送所有到期的延迟ACK
+    deadline = next_ack_deadline(connections)
+    while deadline is not None and deadline <= now:
+        _, addr = heapq.heappop(ack_timers)
+        ack_now(outbox, connections[addr], addr)
+        deadline = next_ack_deadline(connections)
+
+def buffer_room(conn, seq_num, length):#乱序缓存能否放下这个包: 缓存的总字节数不超过RECV_WINDOW
+    # 序列号不在包边界上的表项永远交付不了, 期望序列号越过它们之后就没用了; 缓存满时先清掉这些表项再判断
+    recv_buffer = conn['recv_buffer']
+    old = recv_buffer.get(seq_num)
+    replaced = len(old) if old is not None else 0
+    if conn['buffered'] - replaced + length > RECV_WINDOW:
+        for key in [key for key in recv_buffer if key < conn['expected_seq_num']]:
+            conn['buffered'] -= len(recv_buffer.pop(key))
+    return conn['buffered'] - replaced + length <= RECV_WINDOW
+
+def handle_data(outbox, conn, client_addr, seq_num, data, now):#处理已建立连接上的数据包
+    expected_seq_num = conn['expected_seq_num']
+
+    if conn['selective_repeat']:
+        # 选择重传: 窗口内的乱序包先缓存并立即单独确认(SACK); 按序包按ACK策略累计确认
+        recv_buffer = conn['recv_buffer']
+        if seq_num == expected_seq_num:
+            deliver(conn, data)
+            expected_seq_num += len(data)
+            stats.count('in_order')
+            log.debug('成功接收来自 %s 的按序包 (Seq=%d)', client_addr, seq_num)
+            # 交付缓存中已经连续的包
+            filled = expected_seq_num in recv_buffer
+            while expected_seq_num in recv_buffer:
+                buffered = recv_buffer.pop(expected_seq_num)
+                conn['buffered'] -= len(buffered)
+                deliver(conn, buffered)
+                expected_seq_num += len(buffered)
+            conn['expected_seq_num'] = expected_seq_num
+            if filled:
+                ack_now(outbox, conn, client_addr)  # 填上了空洞, 立即告诉发送方
+            else:
+                ack_in_order(outbox, conn, client_addr, now)
+        elif (expected_seq_num < seq_num and seq_num + len(data) <= expected_seq_num + RECV_WINDOW
+              and buffer_room(conn, seq_num, len(data))):
+            old = recv_buffer.get(seq_num)
+            if old is not None:
+                stats.count('duplicates')
+                conn['buffered'] -= len(old)
+            else:
+                stats.count('out_of_order')
+            recv_buffer[seq_num] = data
+            conn['buffered'] += len(data)
+            log.debug('缓存来自 %s 的乱序包 (Seq=%d), 期望 Seq=%d', client_addr, seq_num, expected_seq_num)
+            ack_now(outbox, conn, client_addr, seq_num, flags=ACK | SACK)
+        elif seq_num > expected_seq_num:
+            # 超出接收窗口(或缓存已满)的包不缓存, 但同样说明前面有空洞, 立即重发累计确认
+            stats.count('out_of_window')
+            log.debug('来自 %s 的包 (Seq=%d) 超出接收窗口, 丢弃', client_addr, seq_num)
+            ack_now(outbox, conn, client_addr)
+        else:
+            # 小于期望序列号的是重复包, 之前的ACK可能丢了, 立即再确认一次
+            stats.count('duplicates')
+            ack_now(outbox, conn, client_addr, seq_num, flags=ACK | SACK)
+        return
+
+    # # 收到了想要的包
+    if seq_num == expected_seq_num:
+        deliver(conn, data)
+        conn['expected_seq_num'] = expected_seq_num + len(data)
+        stats.count('in_order')
+        log.debug('成功接收来自 %s 的按序包 (Seq=%d)', client_addr, seq_num)
+        #累计确认
+        ack_in_order(outbox, conn, client_addr, now)
+    else:
+        # 乱序或重复包: 立即重发当前的累计确认
+        stats.count('duplicates' if seq_num < expected_seq_num else 'out_of_order')
+        log.debug('收到来自 %s 的乱序包 (Seq=%d), 期望 Seq=%d', client_addr, seq_num, expected_seq_num)
+        ack_now(outbox, conn, client_addr)
+
+def handle_packet(outbox, connections, packet, addr, loss_rate, now, output_dir=OUTPUT_DIR,
+                  ack_every=ACK_EVERY, ack_delay=ACK_DELAY):#处理一个数据报, 要回复的包放入outbox
+    seq_num, ack_num, flags, data_len, _ = unpack_header(packet)
+    if flags is None:
+        stats.count('malformed')
+        return
+    conn = connections.get(addr)
+
+    # 1. 连接建立(第一次握手)
+    if flags & SYN:
+        if conn is None and len(connections) >= MAX_CONNECTIONS:
+            stats.count('rejected')
+            log.warning("连接数已达上限 %d, 忽略来自 %s 的 SYN", MAX_CONNECTIONS, addr)
+            return
+        if conn is not None and conn['client_isn'] == seq_num:
+            # 重复的SYN: 还在握手阶段说明SYN-ACK丢了, 再回复一次; 连接已建立时是迟到的副本, 忽略
+            if conn['state'] != SYN_RCVD:
+                return
+        else:
+            # 新连接, 或者同一地址上的客户端重新连接
+            log.info("有一个来自 %s 的 SYN 连接请求 (Seq=%d)", addr, seq_num)
+            if conn is not None:
+                close_connection(conn)
+                del connections[addr]
+            conn = new_connection(seq_num, flags, now, ack_every, ack_delay)
+            if data_len:
+                try:
+                    open_output(conn, packet[HEADER_SIZE:HEADER_SIZE + data_len], output_dir, addr)
+                except (OSError, ValueError, struct.error) as e:
+                    log.error("无法为 %s 创建输出文件: %s", addr, e)
+                    return
+            connections[addr] = conn
+            stats.count('connections')
+
+        # 向客户端回复 SYN-ACK(第二次握手)
+        SYN_ACK_header = pack_header(conn['server_seq'], conn['expected_seq_num'], flags=SYN|ACK)
+        outbox.append((SYN_ACK_header, addr))
+        log.info("已成功向 %s 发送 SYN-ACK (Seq=%d, Ack=%d)", addr, conn['server_seq'], conn['expected_seq_num'])
+        return
+
+    if conn is None:
+        log.debug("收到来自未连接客户端 %s 的包, 忽略", addr)
+        return
+    conn['last_active'] = now
+
+    # 客户端收到 SYN-ACK 后给服务器发送 ACK(第三次握手)
+    if conn['state'] == SYN_RCVD:
+        conn['state'] = ESTABLISHED
+        if flags & ACK:
+            log.info("成功与 %s 建立连接! (Ack=%d)", addr, ack_num)
+            return
+        # 第三次握手的ACK丢了, 但客户端已经开始发数据, 说明它收到了SYN-ACK, 连接同样建立
+        log.info("与 %s 建立连接 (第三次握手的ACK丢失)", addr)
+
+    # 已发送 FIN-ACK, 等待客户端最后的ACK; 这里不阻塞等待, 其他连接照常处理
+    if conn['state'] == LAST_ACK:
+        if flags & FIN:
+            # FIN-ACK 丢了, 客户端重发了FIN
+            outbox.append((conn['fin_ack'], addr))
+        elif flags & ACK:
+            log.info("收到客户端 %s 的ACK确认 (Ack=%d)", addr, ack_num)
+            log.info("The connection with %s has been dropped...", addr)
+            del connections[addr]
+        return
+
+    # 2. 数据传输阶段, 随机丢包
+    if not flags & FIN and random.random() < loss_rate:#小于丢包率才丢
+        "'数据传输才丢包'"
+        stats.count('dropped')
+        log.debug("随机丢弃了来自 %s 的 Seq=%d 包", addr, seq_num)
+        return
+
+    if flags & FIN:
+        log.info("%s 发送了一个 FIN 包 (Seq=%d)", addr, seq_num)
+        # 校验数据, 向客户端发送 FIN-ACK, 带上服务器计算的SHA-256
+        digest = finish_transfer(conn, addr, packet[HEADER_SIZE:HEADER_SIZE + data_len])
+        conn['fin_ack'] = pack_header(0, seq_num + 1, flags=FIN|ACK, data_len=len(digest)) + digest
+        outbox.append((conn['fin_ack'], addr))
+        log.info("已成功向 %s 发送 FIN-ACK (Ack=%d)", addr, seq_num + 1)
+        conn['state'] = LAST_ACK
+        return
+
+    if data_len != len(packet) - HEADER_SIZE:
+        stats.count('malformed')
+        log.debug("来自 %s 的包 (Seq=%d) 数据长度与首部不符, 丢弃", addr, seq_num)
+        return
+    handle_data(outbox, conn, addr, seq_num, packet[HEADER_SIZE:], now)
+
+def sweep_connections(connections, now):#清除等待最后ACK超时的连接和长时间空闲的连接
+    for addr, conn in list(connections.items()):
+        idle = now - conn['last_active']
+        if conn['state'] == LAST_ACK and idle > LAST_ACK_TIMEOUT:
+            log.warning("警告: 等待客户端 %s 的ACK超时", addr)
+            log.info("The connection with %s has been dropped...", addr)
+            del connections[addr]
+        elif idle > IDLE_TIMEOUT:
+            log.info("连接 %s 空闲超过 %.0f s, 已清除", addr, IDLE_TIMEOUT)
+            close_connection(conn)
+            del connections[addr]
+
+def main(host=HOST, port=PORT, loss_rate=PACKET_LOSS_RATE, batch=RECV_BATCH, output_dir=OUTPUT_DIR,
+         ack_every=ACK_EVERY, ack_delay=ACK_DELAY, stats_interval=STATS_INTERVAL, stats_port=STATS_PORT):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_socket.bind((HOST, PORT))
-    print("The server is up, waiting to connect...")
-    print(f"PACKET_LOSS_RATE is: {PACKET_LOSS_RATE * 100}%")
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+    server_socket.bind((host, port))
+    # 非阻塞socket + select: 每次唤醒取走所有已到达的数据报, 处理完再把回复一起发出
+    server_socket.setblocking(False)
+    log.info("The server is up, waiting to connect...")
+    log.info("PACKET_LOSS_RATE is: %s%%", loss_rate * 100)
+    log.info("ACK策略: 每 %d 个按序包确认一次, 最多延迟 %.0f ms", ack_every, ack_delay * 1000)
+    if stats_interval > 0:
+        metrics.start_reporter(lambda: log.info("[stats] %s", stats.format()), stats_interval)
+    if stats_port:
+        metrics.serve_stats(stats, stats_port)
+        log.info("统计信息: http://%s:%d/", metrics.STATS_HOST, stats_port)
 
-    # 表示服务器状态
-    client_addr = None
-    is_connected = False
-    expected_seq_num = 0
+    # 连接状态表: 客户端地址 -> 连接状态, 一个socket同时服务多个客户端
+    connections = {}
+    last_sweep = time.time()
 
     while True:
         try:
-            packet, addr = server_socket.recvfrom(1024)
-
-            # 随机丢包
-            if is_connected:
-                if random.random() < PACKET_LOSS_RATE:#小于丢包率才丢
-                    header_info = unpack_header(packet)
-                    if header_info[2] not in [SYN, FIN]:
-                        "'数据传输才丢包'"
-                        print(f"随机丢弃了来自 {addr} 的 Seq={header_info[0]} 包")
-                        continue
-            
-            seq_num, ack_num, flags, _, _ = unpack_header(packet)
-
-            # 1. 连接建立(第一次握手)
-            if not is_connected:
-                if flags & SYN:
-                    print(f"有一个来自 {addr} 的 SYN 连接请求 (Seq={seq_num})")
-                    client_addr = addr
-                    
-                    # 向客户端回复 SYN-ACK(第二次握手)
-                    server_seq = random.randint(0, 1500)
-                    expected_seq_num = seq_num + 1
-                    
-                    SYN_ACK_header = pack_header(server_seq, expected_seq_num, flags=SYN|ACK)
-                    server_socket.sendto(SYN_ACK_header, client_addr)
-                    print(f"已成功向 {client_addr} 发送 SYN-ACK (Seq={server_seq}, Ack={expected_seq_num})")
-                    continue
-
-            # 客户端收到 SYN-ACK 后给服务器发送 ACK(第三次握手)
-            if not is_connected:
-                if flags & ACK:
-                    print(f"成功与 {client_addr} 建立连接! (Ack={ack_num})")
-                    is_connected = True
-                    continue
-
-            # 2. 数据传输阶段
-            if is_connected:
-                if flags & FIN:
-                    print(f"{client_addr} 发送了一个 FIN 包 (Seq={seq_num})")
-                    # 向客户端发送 FIN-ACK
-                    FIN_ACK_header = pack_header(0, seq_num + 1, flags=FIN|ACK)
-                    server_socket.sendto(FIN_ACK_header, client_addr)
-                    print(f"已成功向 {client_addr} 发送 FIN-ACK (Ack={seq_num + 1})")
-                    
-                    try:
-                        server_socket.settimeout(5.0)
-                        ack_packet, _ = server_socket.recvfrom(1024)
-                        _, ack_num, ack_flags, _, _ = unpack_header(ack_packet)
-                        if ack_flags & ACK:
-                            print(f"收到客户端ACK确认 (Ack={ack_num})")
-                    except socket.timeout:
-                        print("警告: 等待客户端ACK超时")
-                    
-                    # 刷新状态变量
-                    print(f"The connection with {client_addr} has been dropped...")
-                    client_addr = None
-                    is_connected = False
-                    expected_seq_num = 0
-                    continue
-
-                # # 收到了想要的包
-                if seq_num == expected_seq_num:
-                    expected_seq_num += PACKET_SIZE
-                    print(f'成功接收按序包 (Seq={seq_num})')
-                    #累计确认
-                    server_time = time.time()
-                    ack_payload = struct.pack('!d', server_time) # 将时间戳打包为8字节double
-                    ack_header = pack_header(0, expected_seq_num, flags=ACK, data_len=len(ack_payload))
-                    ack_packet = ack_header + ack_payload
-                    server_socket.sendto(ack_packet, client_addr)
-                    print(f"成功向 {client_addr} 发送累计确认 (Ack={expected_seq_num})")                   
-                else:
-                    print(f'收到乱序包 (Seq={seq_num}), 期望 Seq={expected_seq_num}')
+            # 有延迟ACK时最多睡到它到期
+            timeout = SWEEP_INTERVAL
+            deadline = next_ack_deadline(connections)
+            if deadline is not None:
+                timeout = max(0.0, min(timeout, deadline - time.time()))
+            packets = recv_batch(server_socket, batch, timeout)
+            now = time.time()
+            if packets:
+                stats.count('received', len(packets))
+                stats.observe('batch', len(packets))
+            outbox = []
+            for packet, addr in packets:
+                # 逐包捕获异常, 一个出错的数据报不影响同一批中其他客户端的包和已放入outbox的回复
+                try:
+                    handle_packet(outbox, connections, packet, addr, loss_rate, now, output_dir, ack_every, ack_delay)
+                except Exception as e:
+                    stats.count('malformed')
+                    log.error("处理来自 %s 的数据报出错: %s", addr, e)
+            flush_delayed_acks(outbox, connections, now)
+            send_batch(server_socket, outbox)
+            if now - last_sweep >= SWEEP_INTERVAL:
+                sweep_connections(connections, now)
+                last_sweep = now
 
-        except Exception as e:
-            print(f"服务器出错: {e}")
+        except KeyboardInterrupt:
             break
+        except Exception as e:
+            log.error("服务器出错: %s", e)
 
+    for conn in connections.values():
+        close_connection(conn)
     server_socket.close()
-    print("服务器已关闭。")
+    log.info("[stats] %s", stats.format())
+    log.info("服务器已关闭。")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--loss", type=float, default=PACKET_LOSS_RATE, help="模拟丢包率 (0.0-1.0)")
+    parser.add_argument("--batch", type=int, default=RECV_BATCH, help="每次唤醒最多连续收取的数据报数")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="文件传输模式下收到的文件保存的目录")
+    parser.add_argument("--ack-every", type=int, default=ACK_EVERY, help="每收到N个按序包确认一次")
+    parser.add_argument("--ack-delay", type=float, default=ACK_DELAY * 1000,
+                        help="按序包最多延迟多少毫秒确认(--ack-every大于1时生效)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出逐包的接收/确认/丢弃日志")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL,
+                        help="每隔多少秒输出一行计数器/直方图汇总, 0表示不输出")
+    parser.add_argument("--stats-port", type=int, default=STATS_PORT,
+                        help="在本机该端口提供JSON格式的统计(HTTP GET), 0表示不开启")
+    args = parser.parse_args()
+
+    listener = metrics.setup_logging(args.verbose)
+    try:
+        main(args.host, args.port, args.loss, args.batch, args.output_dir, args.ack_every, args.ack_delay / 1000,
+             args.stats_interval, args.stats_port)
+    finally:
+        listener.stop()
\ No newline at end of file
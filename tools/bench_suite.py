@@ -0,0 +1,267 @@
+import socket
+import struct
+import subprocess
+import sys
+import os
+import time
+import json
+import random
+import platform
+import resource
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# ======================== 端到端基准测试 ========================
+# 在本机启动 task1 的 reversetcpserver 和 task2 的 udpserver, 用多个并发客户端压测, 结果以JSON输出:
+#   TCP: 每个客户端一个进程, 在一条连接上逐块发送reverseRequest, 记录每块的往返时延
+#   UDP: 每个客户端是一个 udpclient.py --json 子进程, 汇总其完成时间、goodput 和 RTT 分位数
+# 每种配置都启动一个新的服务器; CPU时间来自 wait4 返回的子进程资源使用量(含启动)
+# 进度输出到stderr, JSON输出到stdout或 --output 文件
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TCP_SERVER = os.path.join(ROOT, "task1", "reversetcpserver.py")
+UDP_SERVER = os.path.join(ROOT, "task2", "udpserver.py")
+UDP_CLIENT = os.path.join(ROOT, "task2", "udpclient.py")
+HOST = "127.0.0.1"
+TCP_HEADER = struct.Struct('>HI')
+ALPHABET = b"abcdefghijklmnopqrstuvwxyz0123456789"
+
+def free_port(kind):
+    s = socket.socket(socket.AF_INET, kind)
+    s.bind((HOST, 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def percentiles(samples):#精确分位数(毫秒), 样本为秒
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    def at(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {'p50': at(0.5), 'p95': at(0.95), 'p99': at(0.99), 'max': ordered[-1] * 1000,
+            'mean': sum(ordered) / len(ordered) * 1000}
+
+def cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+def stop_process(proc):#结束子进程并返回它(含已回收的子孙进程)用掉的CPU秒数
+    proc.terminate()
+    _, _, usage = os.wait4(proc.pid, 0)
+    proc.returncode = 0
+    return cpu_seconds(usage)
+
+# ======================== TCP反转服务 ========================
+def start_tcp_server(mode, port, workers):
+    args = [sys.executable, TCP_SERVER, "--mode", mode, "--host", HOST, "--port", str(port)]
+    if mode == "prefork":
+        args += ["--workers", str(workers)]
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"tcp server ({mode}) did not start")
+
+def recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        buf += chunk
+    return bytes(buf)
+
+def tcp_client(port, blocks, block_size, seed):
+    # 在单独的进程中运行: 握手后逐块发送, 每块等到应答再发下一块
+    rng = random.Random(seed)
+    payload = bytes(rng.choice(ALPHABET) for _ in range(block_size))
+    expected = payload[::-1]  # 纯ASCII, 按字节反转即可
+    cpu_start = cpu_seconds(resource.getrusage(resource.RUSAGE_SELF))
+    start = time.time()
+    latencies = []
+    sock = socket.create_connection((HOST, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        sock.sendall(TCP_HEADER.pack(1, blocks))
+        if struct.unpack('>H', recv_exact(sock, 2))[0] != 2:
+            raise ConnectionError("expected agree packet")
+        request = TCP_HEADER.pack(3, len(payload)) + payload
+        for i in range(blocks):
+            sent = time.perf_counter()
+            sock.sendall(request)
+            _, length = TCP_HEADER.unpack(recv_exact(sock, TCP_HEADER.size))
+            answer = recv_exact(sock, length)
+            latencies.append(time.perf_counter() - sent)
+            if i == 0 and answer != expected:
+                raise RuntimeError("reversed block does not match")
+    finally:
+        sock.close()
+    return {
+        'start': start,
+        'end': time.time(),
+        'latencies': latencies,
+        'cpu': cpu_seconds(resource.getrusage(resource.RUSAGE_SELF)) - cpu_start,
+    }
+
+def run_tcp(mode, clients, blocks, block_size, workers, pool):
+    port = free_port(socket.SOCK_STREAM)
+    server = start_tcp_server(mode, port, workers)
+    try:
+        futures = [pool.submit(tcp_client, port, blocks, block_size, seed) for seed in range(clients)]
+        results = [f.result() for f in futures]
+    finally:
+        server_cpu = stop_process(server)
+
+    wall = max(r['end'] for r in results) - min(r['start'] for r in results)
+    latencies = [x for r in results for x in r['latencies']]
+    return {
+        'mode': mode,
+        'clients': clients,
+        'blocks_per_client': blocks,
+        'block_size': block_size,
+        'wall_s': wall,
+        'requests_per_s': len(latencies) / wall,
+        'mb_per_s': len(latencies) * block_size / wall / 1e6,
+        'latency_ms': percentiles(latencies),
+        'server_cpu_s': server_cpu,
+        'client_cpu_s': sum(r['cpu'] for r in results),
+    }
+
+# ======================== UDP可靠传输 ========================
+def start_udp_server(port, loss_rate):
+    proc = subprocess.Popen(
+        [sys.executable, UDP_SERVER, "--host", HOST, "--port", str(port), "--loss", str(loss_rate)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    time.sleep(0.3)  # 等待服务器绑定端口
+    return proc
+
+def run_udp(loss_rate, clients, count, packet_size, window, mode, cc):
+    port = free_port(socket.SOCK_DGRAM)
+    server = start_udp_server(port, loss_rate)
+    procs = []
+    try:
+        start = time.time()
+        for _ in range(clients):
+            args = [sys.executable, UDP_CLIENT, HOST, str(port), "--mode", mode, "--cc", cc,
+                    "--count", str(count), "--packet-size", str(packet_size), "--json"]
+            if window:
+                args += ["--window", str(window)]
+            procs.append(subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL))
+        results = []
+        client_cpu = 0.0
+        for proc in procs:
+            output = proc.stdout.read()
+            proc.stdout.close()
+            _, _, usage = os.wait4(proc.pid, 0)
+            proc.returncode = 0
+            client_cpu += cpu_seconds(usage)
+            lines = output.decode('utf-8', 'replace').strip().splitlines()
+            try:
+                results.append(json.loads(lines[-1]))
+            except (IndexError, ValueError):
+                results.append(None)  # 握手失败等情况, 客户端没有输出JSON
+        wall = time.time() - start
+    finally:
+        for proc in procs:
+            if proc.returncode is None:
+                proc.kill()
+        server_cpu = stop_process(server)
+
+    done = [r for r in results if r]
+    # 每个客户端的RTT分位数由P²估计, 这里按样本数加权平均, 是近似值
+    samples = sum(r['rtt']['count'] for r in done)
+    rtt = None
+    if samples:
+        rtt = {key: sum((r['rtt'][key] or 0.0) * r['rtt']['count'] for r in done) / samples
+               for key in ('p50', 'p95', 'p99', 'mean')}
+        rtt['max'] = max(r['rtt']['max'] or 0.0 for r in done)
+    return {
+        'loss_rate': loss_rate,
+        'clients': clients,
+        'completed': len(done),
+        'count_per_client': count,
+        'packet_size': packet_size,
+        'window': window,
+        'mode': mode,
+        'cc': cc,
+        'wall_s': wall,
+        'goodput_mb_per_s': sum(r['bytes_sent'] for r in done) / wall / 1e6,
+        'completion_s': percentiles([r['elapsed'] for r in done]),
+        'sends_per_packet': sum(r['total_send_num'] for r in done) / max(1, len(done) * count),
+        'verified': all(r['verified'] for r in done),
+        'rtt_ms': rtt,
+        'server_cpu_s': server_cpu,
+        'client_cpu_s': client_cpu,
+    }
+
+def int_list(value):
+    return [int(x) for x in value.split(",") if x]
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark for the TCP reverse service and the UDP reliable transfer")
+    parser.add_argument("--only", choices=["tcp", "udp"], help="只测其中一个服务")
+    parser.add_argument("--output", help="JSON写入该文件, 默认输出到stdout")
+    # TCP
+    parser.add_argument("--tcp-modes", default="async", help="服务器模式列表: threaded,async,prefork")
+    parser.add_argument("--tcp-workers", type=int, default=os.cpu_count() or 1, help="prefork模式的worker数")
+    parser.add_argument("--tcp-clients", type=int_list, default=[1, 8], help="并发客户端数列表")
+    parser.add_argument("--tcp-block-sizes", type=int_list, default=[64, 4096, 65536], help="块大小列表(字节)")
+    parser.add_argument("--tcp-blocks", type=int, default=2000, help="每个客户端发送的块数")
+    # UDP
+    parser.add_argument("--udp-loss-rates", default="0,0.1", help="服务器模拟丢包率列表")
+    parser.add_argument("--udp-clients", type=int_list, default=[1, 4], help="并发客户端数列表")
+    parser.add_argument("--udp-windows", type=int_list, default=[8192, 65536], help="拥塞窗口上限列表(字节)")
+    parser.add_argument("--udp-packet-size", type=int, default=1024)
+    parser.add_argument("--udp-count", type=int, default=500, help="每个客户端发送的数据包数")
+    parser.add_argument("--udp-mode", choices=["gbn", "sr"], default="sr")
+    parser.add_argument("--udp-cc", default="reno")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'tcp': [],
+        'udp': [],
+    }
+
+    if args.only != "udp":
+        with ProcessPoolExecutor(max_workers=max(args.tcp_clients)) as pool:
+            for mode in args.tcp_modes.split(","):
+                for clients in args.tcp_clients:
+                    for block_size in args.tcp_block_sizes:
+                        row = run_tcp(mode, clients, args.tcp_blocks, block_size, args.tcp_workers, pool)
+                        report['tcp'].append(row)
+                        print(f"tcp {mode} clients={clients} block={block_size}: {row['requests_per_s']:.0f} req/s, "
+                              f"p99 {row['latency_ms']['p99']:.2f} ms", file=sys.stderr)
+
+    if args.only != "tcp":
+        for loss_rate in (float(x) for x in args.udp_loss_rates.split(",")):
+            for clients in args.udp_clients:
+                for window in args.udp_windows:
+                    row = run_udp(loss_rate, clients, args.udp_count, args.udp_packet_size, window,
+                                  args.udp_mode, args.udp_cc)
+                    report['udp'].append(row)
+                    print(f"udp loss={loss_rate} clients={clients} window={window}: "
+                          f"{row['goodput_mb_per_s']:.2f} MB/s, {row['completed']}/{clients} completed", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import socket
+import selectors
+import heapq
+import itertools
+import random
+import threading
+import queue
+import signal
+import time
+import argparse
+
+# ======================== 网络损伤代理 ========================
+# 放在任意客户端和服务器之间, 在两个方向上分别模拟广域网条件:
+#   丢包 / 单向时延+抖动 / 乱序 / 重复 / 带宽限制(带队列上限)
+# UDP: 每个客户端地址对应一个连到服务器的socket, 服务器看到的客户端地址互不相同, 多客户端照常工作
+# TCP: 字节流在用户态不能丢包/乱序/重复, 只模拟时延/抖动/带宽限制, 抖动只会推迟数据, 不会让它提前
+# 所有随机决定都来自 --seed 初始化的随机数生成器, 到达顺序相同时结果可以复现
+# 例: python tools/netem_proxy.py --listen 127.0.0.1:9000 --target 127.0.0.1:11111 --loss 0.1 --delay 25 --jitter 5
+
+# ======================== 代理配置参数 ========================
+MAX_DATAGRAM = 65535     # UDP数据报的最大长度
+RECV_BATCH = 64          # 每次唤醒每个socket最多连续收取的数据报数
+UDP_IDLE_TIMEOUT = 60.0  # UDP客户端空闲超过该时间(秒)就关闭它的上游socket
+SWEEP_INTERVAL = 1.0     # 检查空闲UDP客户端的间隔(秒)
+TCP_CHUNK = 65536        # TCP每次读取的字节数
+TCP_QUEUE_CHUNKS = 64    # TCP每个方向最多排队的数据块数, 满了就不再读, 让TCP自身的流量控制生效
+QUEUE_LIMIT = 1 << 20    # 带宽限制时每个方向最多排队的字节数, 超过时UDP丢弃新到的数据报(丢尾)
+
+def parse_addr(value):#"host:port" -> (host, port)
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+class Link:
+    # 一个方向的链路: 数据先按带宽排队发送, 离开链路后再经过传播时延(含抖动)到达对端
+    def __init__(self, name, args, rng):
+        self.name = name
+        self.loss = args.loss
+        self.delay = args.delay / 1000
+        self.jitter = args.jitter / 1000
+        self.reorder = args.reorder
+        self.reorder_gap = args.reorder_gap / 1000
+        self.duplicate = args.duplicate
+        self.rate = args.rate * 1e6 / 8 if args.rate else None  # 字节/秒
+        self.queue_limit = args.queue
+        self.rng = rng
+        self.busy_until = 0.0  # 带宽限制: 链路上已排队的数据发完的时间
+        self.lock = threading.Lock()  # TCP模式下多个连接的线程共用一条链路
+        self.stats = {'packets': 0, 'bytes': 0, 'lost': 0, 'queue_drops': 0, 'duplicated': 0, 'reordered': 0}
+
+    def transmit(self, size, now):#按带宽计算数据离开链路的时间; 排队超过上限时返回None
+        if self.rate is None:
+            return now
+        start = max(now, self.busy_until)
+        if (start - now) * self.rate > self.queue_limit:
+            return None
+        self.busy_until = start + size / self.rate
+        return self.busy_until
+
+    def latency(self):#单向时延加上均匀分布的抖动
+        if not self.jitter:
+            return self.delay
+        return max(0.0, self.delay + self.rng.uniform(-self.jitter, self.jitter))
+
+    def schedule(self, size, now):#UDP: 返回这个数据报每一份副本的到达时间, 被丢弃时返回空列表
+        self.stats['packets'] += 1
+        self.stats['bytes'] += size
+        if self.loss and self.rng.random() < self.loss:
+            self.stats['lost'] += 1
+            return []
+        copies = 1
+        if self.duplicate and self.rng.random() < self.duplicate:
+            copies = 2
+            self.stats['duplicated'] += 1
+        arrivals = []
+        for _ in range(copies):
+            sent = self.transmit(size, now)
+            if sent is None:
+                self.stats['queue_drops'] += 1
+                continue
+            arrival = sent + self.latency()
+            # 乱序: 这个数据报额外滞留一段时间, 后面的数据报会先到
+            if self.reorder and self.rng.random() < self.reorder:
+                arrival += self.reorder_gap
+                self.stats['reordered'] += 1
+            arrivals.append(arrival)
+        return arrivals
+
+    def schedule_stream(self, size, now, not_before):#TCP: 返回这块数据的到达时间, 不早于同一连接上一块的到达时间
+        with self.lock:
+            self.stats['packets'] += 1
+            self.stats['bytes'] += size
+            if self.rate is None:
+                sent = now
+            else:
+                self.busy_until = max(now, self.busy_until) + size / self.rate
+                sent = self.busy_until
+            return max(sent + self.latency(), not_before)
+
+    def report(self):
+        s = self.stats
+        print(f"{self.name}: {s['packets']} 个包/块, {s['bytes']} 字节, 丢弃 {s['lost']}, 队列溢出 {s['queue_drops']}, "
+              f"重复 {s['duplicated']}, 乱序 {s['reordered']}")
+
+def run_udp(listen, target, up, down):
+    front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    front.bind(listen)
+    front.setblocking(False)
+    sel = selectors.DefaultSelector()
+    sel.register(front, selectors.EVENT_READ, None)
+    print(f"UDP代理 {listen[0]}:{listen[1]} -> {target[0]}:{target[1]}")
+
+    clients = {}  # 客户端地址 -> {'sock': 连到服务器的socket, 'last_active': 时间}
+    pending = []  # 等待送达的数据报: 最小堆, 元素为 (到达时间, 序号, 发送socket, 数据, 目的地址或None)
+    order = itertools.count()  # 到达时间相同时保持先后顺序
+    last_sweep = time.monotonic()
+
+    while True:
+        timeout = SWEEP_INTERVAL
+        if pending:
+            timeout = max(0.0, min(timeout, pending[0][0] - time.monotonic()))
+        for key, _ in sel.select(timeout):
+            sock, client = key.fileobj, key.data
+            now = time.monotonic()
+            for _ in range(RECV_BATCH):
+                try:
+                    data, addr = sock.recvfrom(MAX_DATAGRAM)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                if client is None:
+                    # 客户端 -> 服务器
+                    entry = clients.get(addr)
+                    if entry is None:
+                        upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                        upstream.connect(target)
+                        upstream.setblocking(False)
+                        sel.register(upstream, selectors.EVENT_READ, addr)
+                        entry = clients[addr] = {'sock': upstream, 'last_active': now}
+                    entry['last_active'] = now
+                    for arrival in up.schedule(len(data), now):
+                        heapq.heappush(pending, (arrival, next(order), entry['sock'], data, None))
+                else:
+                    # 服务器 -> 客户端
+                    clients[client]['last_active'] = now
+                    for arrival in down.schedule(len(data), now):
+                        heapq.heappush(pending, (arrival, next(order), front, data, client))
+
+        now = time.monotonic()
+        while pending and pending[0][0] <= now:
+            _, _, sock, data, addr = heapq.heappop(pending)
+            try:
+                if addr is None:
+                    sock.send(data)
+                else:
+                    sock.sendto(data, addr)
+            except OSError:
+                pass  # 发送缓冲区满、服务器不在或socket已关闭, 都当作丢包
+
+        if now - last_sweep >= SWEEP_INTERVAL:
+            for addr, entry in list(clients.items()):
+                if now - entry['last_active'] > UDP_IDLE_TIMEOUT:
+                    sel.unregister(entry['sock'])
+                    entry['sock'].close()
+                    del clients[addr]
+            last_sweep = now
+
+def tcp_pipe(src, dst, link, on_done):
+    # 一个方向的转发: 读线程给数据打上到达时间, 写线程到时间后再发出; 队列满时读线程阻塞
+    pending = queue.Queue(TCP_QUEUE_CHUNKS)
+
+    def reader():
+        last_arrival = 0.0
+        while True:
+            try:
+                data = src.recv(TCP_CHUNK)
+            except OSError:
+                data = b''
+            now = time.monotonic()
+            if data:
+                last_arrival = link.schedule_stream(len(data), now, last_arrival)
+            else:
+                last_arrival = max(now, last_arrival)  # 关闭也要排在已有数据之后
+            pending.put((last_arrival, data))
+            if not data:
+                break
+
+    def sender():
+        while True:
+            arrival, data = pending.get()
+            wait = arrival - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if not data:
+                break
+            try:
+                dst.sendall(data)
+            except OSError:
+                break
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        on_done()
+
+    threading.Thread(target=reader, daemon=True).start()
+    threading.Thread(target=sender, daemon=True).start()
+
+def run_tcp(listen, target, up, down):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(listen)
+    listener.listen(128)
+    print(f"TCP代理 {listen[0]}:{listen[1]} -> {target[0]}:{target[1]}")
+
+    while True:
+        conn, _ = listener.accept()
+        try:
+            upstream = socket.create_connection(target)
+        except OSError as e:
+            print(f"无法连接服务器: {e}")
+            conn.close()
+            continue
+        for s in (conn, upstream):
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # 两个方向都结束后关闭这对socket
+        state = {'open': 2, 'lock': threading.Lock()}
+        def on_done(conn=conn, upstream=upstream, state=state):
+            with state['lock']:
+                state['open'] -= 1
+                if state['open']:
+                    return
+            conn.close()
+            upstream.close()
+
+        tcp_pipe(conn, upstream, up, on_done)
+        tcp_pipe(upstream, conn, down, on_done)
+
+def raise_interrupt(signum, frame):#SIGTERM也按Ctrl+C处理, 退出前输出统计
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP/TCP network impairment proxy")
+    parser.add_argument("--proto", choices=["udp", "tcp"], default="udp")
+    parser.add_argument("--listen", type=parse_addr, required=True, help="代理监听的地址, host:port")
+    parser.add_argument("--target", type=parse_addr, required=True, help="服务器地址, host:port")
+    parser.add_argument("--loss", type=float, default=0.0, help="每个方向的丢包率 (0.0-1.0), 仅UDP")
+    parser.add_argument("--delay", type=float, default=0.0, help="每个方向的单向时延(ms), RTT约为它的2倍")
+    parser.add_argument("--jitter", type=float, default=0.0, help="时延抖动(ms), 在±jitter内均匀分布")
+    parser.add_argument("--reorder", type=float, default=0.0, help="乱序概率, 仅UDP")
+    parser.add_argument("--reorder-gap", type=float, default=10.0, help="乱序的包额外滞留的时间(ms)")
+    parser.add_argument("--duplicate", type=float, default=0.0, help="重复概率, 仅UDP")
+    parser.add_argument("--rate", type=float, default=0.0, help="每个方向的带宽(Mbit/s), 0表示不限")
+    parser.add_argument("--queue", type=int, default=QUEUE_LIMIT, help="带宽限制时每个方向的队列上限(字节), 仅UDP")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    args = parser.parse_args()
+
+    if args.proto == "tcp" and (args.loss or args.reorder or args.duplicate):
+        parser.error("TCP模式只支持 --delay/--jitter/--rate")
+
+    rng = random.Random(args.seed)
+    up = Link("client->server", args, rng)
+    down = Link("server->client", args, rng)
+    signal.signal(signal.SIGTERM, raise_interrupt)
+    try:
+        if args.proto == "udp":
+            run_udp(args.listen, args.target, up, down)
+        else:
+            run_tcp(args.listen, args.target, up, down)
+    except KeyboardInterrupt:
+        pass
+    up.report()
+    down.report()
+
+if __name__ == "__main__":
+    main()